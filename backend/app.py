@@ -1,15 +1,30 @@
 # backend/app.py
 
 import os
+import sys
 import logging
-from flask import Flask, request, jsonify
+import time
+
+import click
+from datetime import date, timedelta
+from flask import Flask, Request, Response, g, request, jsonify, url_for
+from flask.helpers import get_debug_flag
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
 from processador import analisar_comprovante_ocr, processar_documento_com_dados_manuais
+from cache_ocr import cache_ocr
+from fila_jobs import fila_jobs, ConflitoIdempotencia, PENDENTE, EXECUTANDO
+from idempotencia import chave_derivada
+from metricas import metricas
+from documentos import ArquivoRecebido, DocumentoEnviado, DOCUMENTO_LIMITE_MEMORIA
+from conta_azul_client import cliente_conta_azul, registros_venda
+from clientes_google import clientes_google
+from apscheduler.schedulers.background import BackgroundScheduler
 from flask import jsonify
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from . import models, database
+import models, database, carga_vendas
 
 
 # --- CONFIGURAÇÃO INICIAL ---
@@ -21,11 +36,113 @@ CORS(app)
 
 # --- CORREÇÃO: Usa o caminho absoluto para a pasta de uploads ---
 # Isto garante que a pasta é encontrada de forma fiável, em qualquer máquina.
+# Só recebe os arquivos grandes demais para ficarem em memória (ver documentos.py).
 UPLOAD_FOLDER = os.path.abspath('temp_files')
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+# --- BANCO DE DADOS ---
+# Cria as tabelas e índices que ainda não existirem (ex.: vendas_diarias e o índice por data e produto) ao montar o app,
+# em qualquer forma de execução (python app.py, flask run, gunicorn). Sem banco, o upload continua funcionando.
+def _preparar_banco():
+    try:
+        models.Base.metadata.create_all(bind=database.engine)
+        for indice in models.Venda.__table__.indexes: indice.create(bind=database.engine, checkfirst=True)
+    except Exception as e:
+        logging.error(f"Não foi possível preparar as tabelas do banco de dados: {e}")
+
+_preparar_banco()
+
+# --- RECEBIMENTO DOS ARQUIVOS ---
+# Os uploads ficam em memória até DOCUMENTO_LIMITE_MEMORIA; os maiores são gravados direto num arquivo com nome único
+# em UPLOAD_FOLDER, que o DocumentoEnviado adota sem copiar (ver documentos.ArquivoRecebido).
+class RequisicaoComUploadEmMemoria(Request):
+    # Por padrão o Werkzeug manda para o disco todo upload acima de 500 KB.
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        sufixo = os.path.splitext(secure_filename(filename or ''))[1]
+        return ArquivoRecebido(DOCUMENTO_LIMITE_MEMORIA, pasta=app.config['UPLOAD_FOLDER'], sufixo=sufixo)
+
+app.request_class = RequisicaoComUploadEmMemoria
+
+# --- MÉTRICAS E RASTRO POR REQUISIÇÃO ---
+# Com este cabeçalho a resposta JSON traz as etapas medidas durante a requisição; nos jobs, o rastro vai no resultado.
+CABECALHO_RASTRO = 'X-Debug-Trace'
+
+def _rastro_pedido():
+    return request.headers.get(CABECALHO_RASTRO, '').lower() in ('1', 'true', 'sim')
+
+@app.before_request
+def _iniciar_medicao():
+    g.inicio_requisicao = time.perf_counter()
+    g.token_rastro = metricas.iniciar_rastro() if _rastro_pedido() else None
+
+@app.after_request
+def _encerrar_medicao(response):
+    if request.url_rule is not None:
+        metricas.observar(f'http.{request.endpoint}', time.perf_counter() - g.inicio_requisicao)
+        metricas.incrementar('http_respostas_total', rota=request.url_rule.rule, status=response.status_code)
+    if g.get('token_rastro') is not None:
+        rastro, g.token_rastro = metricas.encerrar_rastro(g.token_rastro), None
+        corpo = response.get_json(silent=True) if response.is_json else None
+        if isinstance(corpo, dict): response.set_data(app.json.dumps(dict(corpo, rastro=rastro)))
+    return response
+
+def _receber_documentos(files):
+    documentos = []
+    try:
+        for file in files:
+            documentos.append(DocumentoEnviado.de_recebido(secure_filename(file.filename), file.stream, pasta_temporaria=app.config['UPLOAD_FOLDER']))
+    except Exception:
+        for documento in documentos: documento.descartar()
+        raise
+    return documentos
+
+# --- JOBS EM SEGUNDO PLANO ---
+# Os endpoints só recebem os arquivos e enfileiram o trabalho; o OCR, o Sheets e o Drive rodam na fila_jobs,
+# que também descarta os documentos no fim de cada job.
+def _job_upload(parametros, documentos, progresso):
+    return processar_documento_com_dados_manuais(documentos, parametros['dados'], progresso=progresso,
+                                                 chave_idempotencia=parametros.get('chave_idempotencia'))
+
+def _job_analise(parametros, documentos, progresso):
+    return analisar_comprovante_ocr(documentos, parametros['dados'], progresso=progresso)
+
+fila_jobs.registrar('upload', _job_upload)
+fila_jobs.registrar('analise', _job_analise)
+
+def _pai_do_reloader():
+    # Com o reloader (python app.py ou flask run --debug) o processo pai só vigia os arquivos; quem atende as
+    # requisições é o filho, marcado com WERKZEUG_RUN_MAIN. Sem reloader (gunicorn, flask run) o processo é um só.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true': return False
+    if __name__ == '__main__': return True
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true' and 'run' in sys.argv:
+        return '--reload' in sys.argv or (get_debug_flag() and '--no-reload' not in sys.argv)
+    return False
+
+def _comando_da_cli():
+    # Comandos como `flask sincronizar-vendas` só carregam o app; não devem pegar jobs da fila.
+    return os.environ.get('FLASK_RUN_FROM_CLI') == 'true' and 'run' not in sys.argv
+
+# Os workers sobem ao montar o app, em qualquer forma de execução, e não só em `python app.py`.
+if not _pai_do_reloader() and not _comando_da_cli():
+    fila_jobs.iniciar()
+
+def _resposta_job_enfileirado(job_id):
+    return jsonify({'status': 'PENDENTE', 'job_id': job_id, 'url_status': url_for('status_job', job_id=job_id)}), 202
+
+# --- IDEMPOTÊNCIA DO UPLOAD ---
+# Uma repetição (retry do frontend, clique duplo) tem a mesma chave: o cabeçalho, quando enviado, ou o hash dos
+# arquivos e do formulário. Ela recebe o job já existente (ou o seu resultado) em vez de processar tudo de novo;
+# só um job que falhou é refeito, e nesse caso as etapas que ele já concluiu são puladas.
+CABECALHO_IDEMPOTENCIA = 'Idempotency-Key'
+
+def _resposta_repeticao(job_id):
+    job = fila_jobs.obter(job_id)
+    if job is None or job['status'] in (PENDENTE, EXECUTANDO):
+        return _resposta_job_enfileirado(job_id)
+    return jsonify(dict(job['resultado'], job_id=job_id)), 200
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     logging.info("==========================================================")
@@ -39,30 +156,29 @@ def upload_file():
     logging.info(f"Dados do formulário recebidos: {dados_formulario}")
     logging.info(f"{len(files)} arquivo(s) recebido(s).")
 
-    caminhos_temporarios = []
-    nomes_originais = []
     try:
-        for file in files:
-            filename = secure_filename(file.filename)
-            caminho_temporario = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(caminho_temporario)
-            caminhos_temporarios.append(caminho_temporario)
-            nomes_originais.append(filename)
-        logging.info(f"Arquivos salvos temporariamente em: {app.config['UPLOAD_FOLDER']}")
+        documentos = _receber_documentos(files)
+        logging.info(f"{sum(1 for d in documentos if d.caminho)} arquivo(s) excederam o limite de memória e foram para o disco.")
     except Exception as e:
-        logging.error(f"Erro ao salvar arquivos: {e}", exc_info=True)
-        return jsonify({'status': 'ERRO', 'detalhes': f'Erro interno ao salvar arquivos: {e}'}), 500
+        logging.error(f"Erro ao receber arquivos: {e}", exc_info=True)
+        return jsonify({'status': 'ERRO', 'detalhes': f'Erro interno ao receber arquivos: {e}'}), 500
 
-    # Chama a lógica principal do processador. A limpeza dos ficheiros é feita lá.
-    resultado = processar_documento_com_dados_manuais(caminhos_temporarios, dados_formulario, nomes_originais)
-    
-    logging.info(">>> PROCESSAMENTO DE UPLOAD FINALIZADO. <<<")
-    logging.info("==========================================================")
+    impressao = chave_derivada(documentos, dados_formulario)
+    chave = request.headers.get(CABECALHO_IDEMPOTENCIA) or impressao
+    try:
+        # O processamento (e a limpeza dos documentos) acontece no job.
+        job_id, novo = fila_jobs.enfileirar_idempotente('upload', chave, impressao, {'dados': dados_formulario, 'rastrear': _rastro_pedido(), 'chave_idempotencia': chave}, documentos)
+    except ConflitoIdempotencia as e:
+        for documento in documentos: documento.descartar()
+        return jsonify({'status': 'ERRO', 'detalhes': str(e)}), 422
+    if not novo:
+        for documento in documentos: documento.descartar()
+        logging.info(f">>> REQUISIÇÃO REPETIDA; DEVOLVENDO O JOB {job_id}. <<<")
+        return _resposta_repeticao(job_id)
 
-    if resultado['status'] == 'SUCESSO':
-        return jsonify(resultado), 200
-    else:
-        return jsonify(resultado), 500
+    logging.info(f">>> UPLOAD ENFILEIRADO COMO JOB {job_id}. <<<")
+    logging.info("==========================================================")
+    return _resposta_job_enfileirado(job_id)
 
 
 @app.route('/analisar-comprovante', methods=['POST'])
@@ -76,42 +192,130 @@ def analisar_comprovante_endpoint():
     dados_parciais = request.form.to_dict()
     logging.info(f"Dados parciais recebidos: {dados_parciais}")
 
-    caminhos_temporarios = []
     try:
-        for file in files:
-            filename = secure_filename(file.filename)
-            caminho_temporario = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(caminho_temporario)
-            caminhos_temporarios.append(caminho_temporario)
-        logging.info(f"{len(caminhos_temporarios)} arquivo(s) salvos para análise OCR.")
+        documentos = _receber_documentos(files)
+        logging.info(f"{len(documentos)} arquivo(s) recebidos para análise OCR.")
     except Exception as e:
-        return jsonify({'status': 'ERRO', 'detalhes': f'Erro ao salvar arquivos: {e}'}), 500
+        return jsonify({'status': 'ERRO', 'detalhes': f'Erro ao receber arquivos: {e}'}), 500
     
-    # Chama a função do processador. A limpeza dos ficheiros é feita lá.
-    resultado_ocr = analisar_comprovante_ocr(caminhos_temporarios, dados_parciais)
-    
-    logging.info(">>> ANÁLISE DE COMPROVANTE FINALIZADA. <<<")
+    job_id = fila_jobs.enfileirar('analise', {'dados': dados_parciais, 'rastrear': _rastro_pedido()}, documentos)
+    logging.info(f">>> ANÁLISE DE COMPROVANTE ENFILEIRADA COMO JOB {job_id}. <<<")
+    return _resposta_job_enfileirado(job_id)
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def status_job(job_id):
+    job = fila_jobs.obter(job_id)
+    if job is None:
+        return jsonify({'status': 'ERRO', 'detalhes': 'Job não encontrado.'}), 404
+    return jsonify(job), 200
+
+
+@app.route('/analisar-comprovante/cache', methods=['GET'])
+def estatisticas_cache_ocr():
+    return jsonify(cache_ocr.estatisticas()), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def exportar_metricas():
+    # Formato de texto do Prometheus: histogramas por etapa, contadores (chamadas e erros do Google, jobs, HTTP) e o cache de OCR.
+    # Do cache de OCR, só o tamanho atual é gauge; acertos, falhas e remoções são contadores (nomes terminados em _total).
+    estatisticas = cache_ocr.estatisticas()
+    medidores = {f'cache_ocr_{nome}': estatisticas.pop(nome) for nome in ('itens_memoria', 'bytes_disco')}
+    contadores = {f'cache_ocr_{nome}_total': valor for nome, valor in estatisticas.items()}
+    return Response(metricas.texto_prometheus(medidores, contadores), mimetype='text/plain; version=0.0.4')
+
+
+# --- RELATÓRIOS DE VENDAS (lidos dos resumos diários, não da tabela de vendas) ---
+RELATORIOS_DIAS_PADRAO = 30
 
-    if resultado_ocr['status'] == 'SUCESSO':
-        return jsonify(resultado_ocr['dados']), 200
+def _filtros_relatorio(args):
+    # Período (inicio/fim em AAAA-MM-DD, por padrão os últimos 30 dias) e filtros opcionais de produto e origem.
+    fim = date.fromisoformat(args['fim']) if args.get('fim') else date.today()
+    inicio = date.fromisoformat(args['inicio']) if args.get('inicio') else fim - timedelta(days=RELATORIOS_DIAS_PADRAO - 1)
+    filtros = [models.VendaDiaria.data.between(inicio, fim)]
+    if args.get('produto'): filtros.append(models.VendaDiaria.produto == args['produto'])
+    if args.get('origem'): filtros.append(models.VendaDiaria.origem == args['origem'])
+    return filtros
+
+@app.route('/relatorios/vendas-por-dia', methods=['GET'])
+def relatorio_vendas_por_dia():
+    try:
+        filtros = _filtros_relatorio(request.args)
+    except ValueError:
+        return jsonify({'status': 'ERRO', 'detalhes': 'Datas devem estar no formato AAAA-MM-DD.'}), 400
+    resumo = models.VendaDiaria
+    with database.SessionLocal() as db:
+        linhas = db.query(resumo.data, func.sum(resumo.valor_total), func.sum(resumo.quantidade_vendas)) \
+            .filter(*filtros).group_by(resumo.data).order_by(resumo.data).all()
+    return jsonify([{'dia': dia.isoformat(), 'totalVendas': round(total or 0, 2), 'quantidadeVendas': quantidade}
+                    for dia, total, quantidade in linhas]), 200
+
+@app.route('/relatorios/produtos-mais-vendidos', methods=['GET'])
+def relatorio_produtos_mais_vendidos():
+    try:
+        filtros = _filtros_relatorio(request.args)
+        limite = int(request.args.get('limite', 10))
+        if limite < 1: raise ValueError(limite)
+    except ValueError:
+        return jsonify({'status': 'ERRO', 'detalhes': 'Parâmetros inválidos: datas em AAAA-MM-DD e limite inteiro a partir de 1.'}), 400
+    limite = min(limite, 100)
+    resumo = models.VendaDiaria
+    total = func.sum(resumo.valor_total)
+    with database.SessionLocal() as db:
+        linhas = db.query(resumo.produto, total, func.sum(resumo.quantidade_vendas)) \
+            .filter(*filtros).group_by(resumo.produto).order_by(total.desc()).limit(limite).all()
+    return jsonify([{'produto': produto, 'totalVendas': round(valor or 0, 2), 'quantidadeVendas': quantidade}
+                    for produto, valor, quantidade in linhas]), 200
+
+
+def sincronizar_vendas_conta_azul(data_inicial=None, data_final=None):
+    """
+    Sem datas, busca o que mudou desde o cursor salvo (ver `vendas_desde_cursor`) e avança o cursor. Com datas,
+    é uma carga retroativa do período: grava as vendas e os resumos sem mexer no cursor.
+    """
+    if data_inicial is None:
+        vendas, novo_cursor = cliente_conta_azul.vendas_desde_cursor()
     else:
-        return jsonify({'detalhes': resultado_ocr['detalhes']}), 500
-    
+        vendas, novo_cursor = cliente_conta_azul.vendas_do_periodo(data_inicial, data_final or date.today()), None
+    print(f"{len(vendas)} venda(s) obtidas do Conta Azul.")
+    resumo = carga_vendas.carregar_vendas(registros_venda(vendas))
+    print(f"Vendas gravadas: {resumo['inseridos']} nova(s), {resumo['atualizados']} atualizada(s), {resumo['ignorados']} ignorada(s).")
+    # Só os dias que receberam vendas novas ou alteradas têm o resumo recalculado.
+    carga_vendas.atualizar_resumos_diarios(resumo['dias'])
+    if novo_cursor: cliente_conta_azul.salvar_cursor(novo_cursor)
+    return resumo
 
-    
-app = Flask(__name__)
+# Carga retroativa (ex.: na primeira instalação): flask --app app sincronizar-vendas --inicio 2025-01-01 [--fim 2025-06-30]
+@app.cli.command('sincronizar-vendas')
+@click.option('--inicio', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help='Primeiro dia (AAAA-MM-DD).')
+@click.option('--fim', type=click.DateTime(formats=['%Y-%m-%d']), help='Último dia (AAAA-MM-DD); hoje, se omitido.')
+def comando_sincronizar_vendas(inicio, fim):
+    sincronizar_vendas_conta_azul(inicio.date(), fim.date() if fim else None)
+
+# Login interativo no Google, feito uma vez por quem instala o backend (abre o navegador e grava o token.json).
+# O app nunca abre esse login sozinho: sem token, os uploads falham pedindo este comando.
+@app.cli.command('autorizar-google')
+@click.option('--porta', default=8080, show_default=True, help='Porta local que recebe o retorno do login.')
+def comando_autorizar_google(porta):
+    clientes_google.autorizar(porta)
+    print(f"Acesso autorizado; token gravado em '{clientes_google.arquivo_token}'.")
 
 # Função que será executada diariamente
 def tarefa_diaria_sincronizacao():
     print("Iniciando sincronização diária de dados das APIs...")
-    # Aqui você chamará as funções para buscar dados do Conta Azul e TOTVS
-    # Ex: sync_conta_azul()
+    try:
+        sincronizar_vendas_conta_azul()
+    except Exception as e:
+        logging.error(f"Erro na sincronização com o Conta Azul: {e}", exc_info=True)
     # Ex: sync_totvs_chef()
     print("Sincronização concluída.")
 
 if __name__ == '__main__':
-    scheduler = BackgroundScheduler(daemon=True)
-    # Agenda a tarefa para rodar todos os dias à 1 da manhã
-    scheduler.add_job(tarefa_diaria_sincronizacao, 'cron', hour=1)
-    scheduler.start()
+    # Com o reloader do Flask o processo pai só vigia os arquivos: o agendador roda no filho, que atende as requisições.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        scheduler = BackgroundScheduler(daemon=True)
+        # Agenda a tarefa para rodar todos os dias à 1 da manhã
+        scheduler.add_job(tarefa_diaria_sincronizacao, 'cron', hour=1)
+        scheduler.start()
     app.run(debug=True, port=5000)
\ No newline at end of file
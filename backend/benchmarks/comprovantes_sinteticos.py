@@ -0,0 +1,86 @@
+# backend/benchmarks/comprovantes_sinteticos.py
+# Gera comprovantes de pagamento em PDF com fornecedor, valor e data conhecidos, para medir velocidade e acerto da extração.
+
+import io
+import random
+from datetime import date, timedelta
+
+# Apelidos do mapeamento de fornecedores usados nos comprovantes (só ASCII, para caber na fonte padrão do PDF).
+APELIDOS = ['rio quality', 'nossos sabores', 'choconata', 'brasfruto', 'illy', 'nobredo', 'tortamania',
+            'zona zen', 'di brownie', 'quebra nozes', 'clube dos sabores', 'tudo legal', 'riopar', 'maran']
+
+
+def _valor_brl(centavos):
+    return f"{centavos // 100:,}".replace(',', '.') + f",{centavos % 100:02d}"
+
+def _linhas_comprovante(apelido, valor_brl, data_pagamento, gerador):
+    cnpj = f"{gerador.randint(10, 99)}.{gerador.randint(100, 999)}.{gerador.randint(100, 999)}/0001-{gerador.randint(10, 99)}"
+    return [
+        "BANCO EXEMPLO S.A.",
+        "Comprovante de transferencia",
+        f"Favorecido: {apelido.upper()} LTDA",
+        f"CNPJ: {cnpj}",
+        f"Valor: R$ {valor_brl}",
+        f"Data do pagamento: {data_pagamento}",
+        f"Autenticacao: {gerador.getrandbits(64):016X}",
+    ]
+
+def _escapar_pdf(texto):
+    return texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def pdf_com_camada_de_texto(linhas):
+    """Monta à mão um PDF de uma página com as linhas em Helvetica (sem dependências), como os gerados pelos bancos."""
+    conteudo = "BT /F1 12 Tf 16 TL 72 760 Td " + " ".join(f"({_escapar_pdf(linha)}) Tj T*" for linha in linhas) + " ET"
+    objetos = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        f"<< /Length {len(conteudo.encode('latin-1'))} >>\nstream\n{conteudo}\nendstream",
+    ]
+    saida = io.BytesIO()
+    saida.write(b"%PDF-1.4\n")
+    posicoes = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posicoes.append(saida.tell())
+        saida.write(f"{numero} 0 obj\n{objeto}\nendobj\n".encode('latin-1'))
+    inicio_xref = saida.tell()
+    saida.write(f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode('latin-1'))
+    for posicao in posicoes:
+        saida.write(f"{posicao:010d} 00000 n \n".encode('latin-1'))
+    saida.write(f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode('latin-1'))
+    return saida.getvalue()
+
+def pdf_escaneado(linhas, gerador):
+    """PDF só com imagem (sem camada de texto), como um comprovante fotografado ou digitalizado."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    imagem = Image.new('L', (1240, 1754), 255)
+    desenho = ImageDraw.Draw(imagem)
+    fonte = ImageFont.load_default(size=36)
+    for i, linha in enumerate(linhas):
+        desenho.text((120, 150 + i * 60), linha, fill=0, font=fonte)
+    # Uma leve inclinação imita a digitalização.
+    imagem = imagem.rotate(gerador.uniform(-0.8, 0.8), fillcolor=255)
+    saida = io.BytesIO()
+    imagem.save(saida, 'PDF', resolution=150)
+    return saida.getvalue()
+
+def gerar_comprovantes(quantidade, escaneados=False, semente=42, mapeamento=None):
+    """
+    Devolve `quantidade` comprovantes: dicts com 'nome', 'conteudo' (bytes do PDF) e os valores esperados
+    'apelido', 'fornecedor' (nome padronizado, se `mapeamento` for informado), 'valor' e 'pagamento'.
+    """
+    gerador = random.Random(semente)
+    comprovantes = []
+    for i in range(quantidade):
+        apelido = gerador.choice(APELIDOS)
+        valor_brl = _valor_brl(gerador.randint(1_000, 2_500_000))
+        data_pagamento = (date(2025, 1, 1) + timedelta(days=gerador.randint(0, 364))).strftime('%d/%m/%Y')
+        linhas = _linhas_comprovante(apelido, valor_brl, data_pagamento, gerador)
+        conteudo = pdf_escaneado(linhas, gerador) if escaneados else pdf_com_camada_de_texto(linhas)
+        comprovantes.append({
+            'nome': f"comprovante_{'escaneado' if escaneados else 'texto'}_{i:04d}.pdf", 'conteudo': conteudo,
+            'apelido': apelido, 'fornecedor': (mapeamento or {}).get(apelido), 'valor': valor_brl, 'pagamento': data_pagamento,
+        })
+    return comprovantes
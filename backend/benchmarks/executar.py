@@ -0,0 +1,314 @@
+# backend/benchmarks/executar.py
+"""
+Benchmark de ponta a ponta do backend, sem rede: o Google Sheets, o Google Drive e a API do Conta Azul são
+substituídos por versões locais com latência configurável (falsos.py) e os comprovantes são PDFs sintéticos
+com fornecedor, valor e data conhecidos (comprovantes_sinteticos.py), o que permite medir também o acerto.
+
+Para cada cenário informa p50/p95 de latência, vazão e o pico de RSS do processo (e dos processos de OCR).
+
+Uso, a partir da pasta backend:
+    python benchmarks/executar.py
+    python benchmarks/executar.py --quantidade 100 --concorrencia 8 --latencia-sheets 0.2 --saida resultado.json
+    python benchmarks/executar.py --cenarios analise padronizacao
+"""
+
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+PASTA_BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# O backend importa os módulos vizinhos pelo nome (processador, motor_ocr, models...).
+sys.path.insert(0, PASTA_BACKEND)
+
+CENARIOS = ('analise', 'padronizacao', 'processamento', 'endpoints', 'sincronizacao')
+
+
+def _configurar_ambiente(pasta, args):
+    # Precisa acontecer antes de importar o backend, que lê a configuração na importação.
+    os.environ.update({
+        'GOOGLE_COTA_ESTADO': os.path.join(pasta, 'google_cota.json'),
+        'GOOGLE_COTA_SHEETS_LEITURA_POR_MINUTO': str(args.cota_sheets),
+        'GOOGLE_COTA_SHEETS_ESCRITA_POR_MINUTO': str(args.cota_sheets),
+        'OCR_CACHE_PASTA': os.path.join(pasta, 'ocr_cache'),
+        'JOBS_DB': os.path.join(pasta, 'jobs.db'),
+        'IDEMPOTENCIA_DB': os.path.join(pasta, 'idempotencia.db'),
+        'DATABASE_URL': f"sqlite:///{os.path.join(pasta, 'vendas.db')}",
+        'CONTA_AZUL_CURSOR_FILE': os.path.join(pasta, 'conta_azul_cursor.json'),
+        'GOOGLE_SHEET_ID': 'planilha-benchmark',
+    })
+    for mes in range(1, 13):
+        os.environ[f'DRIVE_ID_MONTH_{mes}'] = f'pasta-mes-{mes}'
+        os.environ[f'SHEETS_ID_MONTH_{mes}'] = f'https://docs.google.com/spreadsheets/d/planilha-benchmark/edit#gid={mes}'
+    os.chdir(pasta)
+
+
+# --- MEDIÇÃO ---
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))]
+
+def _pico_rss_mb():
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    # No Linux ru_maxrss vem em KB; no macOS, em bytes.
+    unidade = 1 if sys.platform == 'darwin' else 1024
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(pico * unidade / (1024 * 1024), 1)
+
+def medir(nome, funcao, entradas, concorrencia):
+    """Executa funcao(entrada) para cada entrada, com `concorrencia` threads, e resume latência e vazão."""
+    latencias = [None] * len(entradas)
+
+    def executar(i):
+        inicio = time.perf_counter()
+        resultado = funcao(entradas[i])
+        latencias[i] = time.perf_counter() - inicio
+        return resultado
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(executar, range(len(entradas))))
+    duracao = time.perf_counter() - inicio
+    return resultados, {
+        'cenario': nome, 'n': len(entradas), 'concorrencia': concorrencia,
+        'p50_ms': round(_percentil(latencias, 50) * 1000, 2), 'p95_ms': round(_percentil(latencias, 95) * 1000, 2),
+        'vazao_por_s': round(len(entradas) / duracao, 2), 'duracao_s': round(duracao, 3), 'pico_rss_mb': _pico_rss_mb(),
+    }
+
+def _acerto(acertos, total):
+    return round(acertos / total, 4) if total else None
+
+
+# --- CENÁRIOS ---
+def cenario_analise(args, relatorio):
+    from processador import analisar_comprovante_ocr, mapeamento_fornecedores, _normalize_valor_to_decimal
+    from indice_fornecedores import obter_indice
+    from documentos import DocumentoEnviado
+    from comprovantes_sinteticos import gerar_comprovantes
+
+    indice = obter_indice(mapeamento_fornecedores)
+    conjuntos = [('texto', gerar_comprovantes(args.quantidade, semente=args.semente, mapeamento=mapeamento_fornecedores))]
+    if args.escaneados:
+        if shutil.which('tesseract') and shutil.which('pdftoppm'):
+            conjuntos.append(('escaneado', gerar_comprovantes(args.escaneados, escaneados=True, semente=args.semente + 1, mapeamento=mapeamento_fornecedores)))
+        else:
+            relatorio.append({'cenario': 'analise_comprovante[escaneado]', 'ignorado': 'tesseract/pdftoppm não encontrados no PATH'})
+
+    def analisar(comprovante):
+        return analisar_comprovante_ocr([DocumentoEnviado(comprovante['nome'], conteudo=comprovante['conteudo'])], {})['dados']
+
+    for tipo, comprovantes in conjuntos:
+        # A segunda rodada repete os mesmos arquivos e mede o caminho do cache de OCR.
+        for rodada in ('frio', 'cache'):
+            resultados, resumo = medir(f'analise_comprovante[{tipo},{rodada}]', analisar, comprovantes, args.concorrencia)
+            acertos = {'fornecedor': 0, 'valor': 0, 'pagamento': 0}
+            for esperado, dados in zip(comprovantes, resultados):
+                acertos['fornecedor'] += indice.padronizar(dados.get('fornecedor') or '') == esperado['fornecedor']
+                acertos['valor'] += _normalize_valor_to_decimal(dados.get('valor')) == _normalize_valor_to_decimal(esperado['valor'])
+                acertos['pagamento'] += dados.get('pagamento') == esperado['pagamento']
+            resumo['acerto'] = {campo: _acerto(n, len(comprovantes)) for campo, n in acertos.items()}
+            relatorio.append(resumo)
+
+def _com_erro_de_digitacao(texto, gerador):
+    # Remove, troca ou duplica uma letra, como num nome digitado às pressas no formulário.
+    if len(texto) < 4: return texto
+    i = gerador.randrange(1, len(texto) - 1)
+    return gerador.choice([texto[:i] + texto[i + 1:], texto[:i] + texto[i + 1] + texto[i] + texto[i + 2:], texto[:i] + texto[i] + texto[i:]])
+
+def cenario_padronizacao(args, relatorio):
+    from processador import _padronizar_dados, mapeamento_fornecedores
+
+    gerador = random.Random(args.semente)
+    apelidos = sorted(mapeamento_fornecedores)
+    formularios = []
+    for i in range(args.quantidade * 20):
+        # Metade dos nomes vem exatamente como no mapeamento; a outra metade, com um erro de digitação.
+        apelido = gerador.choice(apelidos)
+        vencimento = date(2025, 1, 1) + timedelta(days=gerador.randint(0, 364))
+        nome = apelido if i % 2 == 0 else _com_erro_de_digitacao(apelido, gerador)
+        formularios.append(({'fornecedor': nome.upper(), 'valor': '1.234,56', 'vencimento': vencimento.isoformat()}, mapeamento_fornecedores[apelido]))
+
+    resultados, resumo = medir('padronizar_dados', lambda entrada: _padronizar_dados(dict(entrada[0])), formularios, args.concorrencia)
+    acertos = [dados['nome_padronizado'] == esperado for dados, (_, esperado) in zip(resultados, formularios)]
+    resumo['acerto'] = {'fornecedor_exato': _acerto(sum(acertos[0::2]), len(acertos[0::2])),
+                        'fornecedor_com_erro': _acerto(sum(acertos[1::2]), len(acertos[1::2]))}
+    relatorio.append(resumo)
+
+def _formularios_de_upload(comprovantes):
+    formularios = []
+    for comprovante in comprovantes:
+        vencimento = datetime.strptime(comprovante['pagamento'], '%d/%m/%Y').date()
+        formularios.append({'fornecedor': comprovante['apelido'], 'valor': comprovante['valor'], 'vencimento': vencimento.isoformat(),
+                            'pagamento': vencimento.isoformat(), 'meio_pagamento': 'PIX', 'numero_nota': comprovante['nome'][-8:-4]})
+    return formularios
+
+def _instalar_google_falso(args, comprovantes):
+    # Metade dos comprovantes já tem linha na planilha (caminho de atualização); a outra metade vira linha nova.
+    from clientes_google import clientes_google
+    from indice_planilha import descartar_indices
+    from falsos import DriveFalso, GspreadFalso
+
+    linhas_por_aba = {}
+    for comprovante in comprovantes[::2]:
+        mes = int(comprovante['pagamento'][3:5])
+        linhas_por_aba.setdefault(mes, []).append([comprovante['fornecedor'], '', '', comprovante['valor'], '', comprovante['pagamento'], ''])
+    gspread_falso = GspreadFalso(args.latencia_sheets, linhas_por_aba, cota_por_minuto=args.cota_sheets_falsa or None)
+    drive_falso = DriveFalso(args.latencia_drive)
+    descartar_indices()
+    clientes_google.definir(gspread_client=gspread_falso, drive_service=drive_falso)
+    return gspread_falso, drive_falso
+
+def cenario_processamento(args, relatorio):
+    from processador import processar_documento_com_dados_manuais, mapeamento_fornecedores
+    from documentos import DocumentoEnviado
+    from comprovantes_sinteticos import gerar_comprovantes
+
+    comprovantes = gerar_comprovantes(args.quantidade, semente=args.semente + 2, mapeamento=mapeamento_fornecedores)
+    gspread_falso, drive_falso = _instalar_google_falso(args, comprovantes)
+    entradas = list(zip(comprovantes, _formularios_de_upload(comprovantes)))
+
+    def processar(entrada):
+        comprovante, formulario = entrada
+        return processar_documento_com_dados_manuais([DocumentoEnviado(comprovante['nome'], conteudo=comprovante['conteudo'])], dict(formulario))
+
+    resultados, resumo = medir('processar_documento_com_dados_manuais', processar, entradas, args.concorrencia)
+    resumo['acerto'] = {'sucesso': _acerto(sum(r['status'] == 'SUCESSO' for r in resultados), len(resultados))}
+    resumo['chamadas'] = dict(gspread_falso.contador.chamadas, **drive_falso.contador.chamadas)
+    relatorio.append(resumo)
+
+def cenario_endpoints(args, relatorio):
+    try:
+        import app as modulo_app
+    except ImportError as e:
+        relatorio.append({'cenario': 'endpoints', 'ignorado': f'não foi possível importar o app: {e}'})
+        return
+    from processador import mapeamento_fornecedores, _normalize_valor_to_decimal
+    from fila_jobs import CONCLUIDO, ERRO
+    from comprovantes_sinteticos import gerar_comprovantes
+
+    comprovantes = gerar_comprovantes(args.quantidade, semente=args.semente + 3, mapeamento=mapeamento_fornecedores)
+    _instalar_google_falso(args, comprovantes)
+    entradas = list(zip(comprovantes, _formularios_de_upload(comprovantes)))
+
+    def enviar_e_aguardar(rota, comprovante, formulario):
+        # Mede do POST até o job terminar, como o frontend percebe (aguardarJob).
+        cliente = modulo_app.app.test_client()
+        dados = dict(formulario, documento=(io.BytesIO(comprovante['conteudo']), comprovante['nome']))
+        resposta = cliente.post(rota, data=dados, content_type='multipart/form-data')
+        url_status = resposta.get_json()['url_status']
+        while True:
+            job = cliente.get(url_status).get_json()
+            if job['status'] in (CONCLUIDO, ERRO): return job
+            time.sleep(0.02)
+
+    resultados, resumo = medir('POST /upload', lambda e: enviar_e_aguardar('/upload', *e), entradas, args.concorrencia)
+    resumo['acerto'] = {'sucesso': _acerto(sum(job['status'] == CONCLUIDO for job in resultados), len(resultados))}
+    relatorio.append(resumo)
+
+    resultados, resumo = medir('POST /analisar-comprovante', lambda e: enviar_e_aguardar('/analisar-comprovante', e[0], {}), entradas, args.concorrencia)
+    dados = [(job.get('resultado') or {}).get('dados') or {} for job in resultados]
+    resumo['acerto'] = {
+        'valor': _acerto(sum(_normalize_valor_to_decimal(d.get('valor')) == _normalize_valor_to_decimal(c['valor']) for d, c in zip(dados, comprovantes)), len(dados)),
+        'pagamento': _acerto(sum(d.get('pagamento') == c['pagamento'] for d, c in zip(dados, comprovantes)), len(dados)),
+    }
+    relatorio.append(resumo)
+
+def cenario_sincronizacao(args, relatorio):
+    import carga_vendas, database, models
+    from conta_azul_client import ClienteContaAzul, registros_venda
+    from falsos import ServidorContaAzulFalso
+
+    models.Base.metadata.create_all(bind=database.engine)
+    hoje = date(2025, 6, 30)
+    with ServidorContaAzulFalso(vendas_por_dia=args.vendas_por_dia, latencia=args.latencia_conta_azul) as servidor:
+        cliente = ClienteContaAzul(base_url=servidor.url, api_key='benchmark', arquivo_cursor=os.environ['CONTA_AZUL_CURSOR_FILE'])
+        etapas = {}
+        inicio = time.perf_counter()
+        vendas = cliente.vendas_do_periodo(hoje - timedelta(days=args.dias_sincronizacao - 1), hoje)
+        etapas['busca_s'] = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        resumo_carga = carga_vendas.carregar_vendas(registros_venda(vendas))
+        etapas['carga_s'] = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        carga_vendas.atualizar_resumos_diarios(resumo_carga['dias'])
+        etapas['resumos_s'] = time.perf_counter() - inicio
+        chamadas = servidor.contador.chamadas
+
+    linhas = resumo_carga['inseridos'] + resumo_carga['atualizados'] + resumo_carga['ignorados']
+    relatorio.append({
+        'cenario': 'sincronizacao_conta_azul', 'n': len(vendas), 'dias': args.dias_sincronizacao,
+        'vazao_por_s': round(linhas / etapas['carga_s'], 2) if etapas['carga_s'] else None,
+        **{nome: round(valor, 3) for nome, valor in etapas.items()},
+        'linhas': {chave: valor for chave, valor in resumo_carga.items() if chave != 'dias'}, 'chamadas': chamadas, 'pico_rss_mb': _pico_rss_mb(),
+    })
+
+
+# --- EXECUÇÃO ---
+EXECUTORES = {'analise': cenario_analise, 'padronizacao': cenario_padronizacao, 'processamento': cenario_processamento,
+              'endpoints': cenario_endpoints, 'sincronizacao': cenario_sincronizacao}
+
+def _imprimir(relatorio):
+    for resumo in relatorio:
+        if 'ignorado' in resumo:
+            print(f"{resumo['cenario']:<48} ignorado: {resumo['ignorado']}")
+            continue
+        partes = [f"n={resumo['n']}"]
+        if 'p50_ms' in resumo: partes += [f"p50={resumo['p50_ms']}ms", f"p95={resumo['p95_ms']}ms"]
+        partes += [f"vazão={resumo['vazao_por_s']}/s", f"RSS pico={resumo['pico_rss_mb']}MB"]
+        if 'acerto' in resumo: partes.append('acerto ' + ', '.join(f"{campo}={valor:.1%}" for campo, valor in resumo['acerto'].items()))
+        print(f"{resumo['cenario']:<48} " + '  '.join(partes))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cenarios', nargs='+', choices=CENARIOS, default=list(CENARIOS))
+    parser.add_argument('--quantidade', type=int, default=30, help='comprovantes por cenário')
+    parser.add_argument('--escaneados', type=int, default=5, help='comprovantes escaneados (exigem Tesseract e Poppler); 0 desliga')
+    parser.add_argument('--concorrencia', type=int, default=4)
+    parser.add_argument('--latencia-sheets', type=float, default=0.1, help='segundos por chamada ao Sheets falso')
+    parser.add_argument('--latencia-drive', type=float, default=0.15, help='segundos por chamada ao Drive falso')
+    parser.add_argument('--cota-sheets', type=float, default=6000, help='cota por minuto configurada no limitador_google (leitura e escrita)')
+    parser.add_argument('--cota-sheets-falsa', type=float, default=0, help='o Sheets falso responde 429 acima desta cota por minuto; 0 desliga')
+    parser.add_argument('--latencia-conta-azul', type=float, default=0.05, help='segundos por página do Conta Azul falso')
+    parser.add_argument('--vendas-por-dia', type=int, default=200)
+    parser.add_argument('--dias-sincronizacao', type=int, default=90)
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--saida', help='grava o relatório em JSON neste arquivo')
+    parser.add_argument('--verbose', action='store_true', help='mantém os logs do backend')
+    args = parser.parse_args(argv)
+    saida = os.path.abspath(args.saida) if args.saida else None
+
+    pasta = tempfile.mkdtemp(prefix='benchmark-backend-')
+    diretorio_original = os.getcwd()
+    _configurar_ambiente(pasta, args)
+    import processador # noqa: F401 (configura o logging do backend)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    relatorio = []
+    try:
+        for nome in args.cenarios:
+            EXECUTORES[nome](args, relatorio)
+    finally:
+        os.chdir(diretorio_original)
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    _imprimir(relatorio)
+    if saida:
+        with open(saida, 'w', encoding='utf-8') as f:
+            json.dump({'argumentos': vars(args), 'resultados': relatorio}, f, ensure_ascii=False, indent=2)
+    return relatorio
+
+
+if __name__ == '__main__':
+    main()
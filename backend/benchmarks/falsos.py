@@ -0,0 +1,227 @@
+# backend/benchmarks/falsos.py
+# Substitutos locais do Google Sheets (gspread), do Google Drive e da API do Conta Azul, com latência configurável.
+
+import itertools
+import json
+import re
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+CABECALHO_PADRAO = ['Conta', 'Meio Pagto', 'Nro NF', 'Valor', 'Data de Emissão da nota', 'Data de vencimento', 'Data do pagamento']
+
+
+class ErroCotaFalso(Exception):
+    """Imita o erro 429 das APIs do Google (o status fica em `response.status_code`, como no gspread)."""
+
+    class _Resposta:
+        status_code, headers = 429, {}
+
+    response = _Resposta()
+
+
+class ContadorChamadas:
+    """Conta as chamadas por nome; com `cota_por_minuto`, responde 429 às que passarem da cota nos últimos 60 s."""
+
+    def __init__(self, cota_por_minuto=None):
+        self._lock = threading.Lock()
+        self.chamadas = {}
+        self.cota_por_minuto = cota_por_minuto
+        self._recentes = deque()
+
+    def registrar(self, nome):
+        with self._lock:
+            self.chamadas[nome] = self.chamadas.get(nome, 0) + 1
+            if not self.cota_por_minuto: return
+            agora = time.monotonic()
+            while self._recentes and agora - self._recentes[0] > 60: self._recentes.popleft()
+            if len(self._recentes) >= self.cota_por_minuto:
+                self.chamadas['recusadas_429'] = self.chamadas.get('recusadas_429', 0) + 1
+                raise ErroCotaFalso(f"Cota de {self.cota_por_minuto:g} chamadas por minuto excedida em {nome}.")
+            self._recentes.append(agora)
+
+
+# --- GOOGLE SHEETS ---
+class WorksheetFalsa:
+    """Aba em memória com a mesma interface que o processador usa do gspread.Worksheet."""
+
+    def __init__(self, titulo, latencia, contador, linhas=None):
+        self.title = titulo
+        self.latencia = latencia
+        self.contador = contador
+        self._lock = threading.Lock()
+        self._linhas = [list(CABECALHO_PADRAO)] + [list(linha) for linha in (linhas or [])]
+
+    def _chamada(self, nome):
+        self.contador.registrar(f'sheets.{nome}')
+        time.sleep(self.latencia)
+
+    def get_all_values(self):
+        self._chamada('get_all_values')
+        with self._lock: return [list(linha) for linha in self._linhas]
+
+    def row_values(self, numero_linha):
+        self._chamada('row_values')
+        with self._lock: return list(self._linhas[numero_linha - 1]) if numero_linha <= len(self._linhas) else []
+
+    def batch_update(self, dados, value_input_option=None):
+        self._chamada('batch_update')
+        with self._lock:
+            for item in dados:
+                linha, coluna = a1_to_rowcol(item['range'])
+                while len(self._linhas) < linha: self._linhas.append([])
+                dados_linha = self._linhas[linha - 1]
+                if len(dados_linha) < coluna: dados_linha.extend([''] * (coluna - len(dados_linha)))
+                dados_linha[coluna - 1] = item['values'][0][0]
+        return {}
+
+    def append_rows(self, linhas, value_input_option=None):
+        self._chamada('append_rows')
+        with self._lock:
+            primeira = len(self._linhas) + 1
+            self._linhas.extend(list(linha) for linha in linhas)
+            ultima = len(self._linhas)
+        fim = rowcol_to_a1(ultima, max((len(linha) for linha in linhas), default=1))
+        return {'updates': {'updatedRange': f"'{self.title}'!A{primeira}:{fim}"}}
+
+class PlanilhaFalsa:
+    def __init__(self, latencia, contador, linhas_por_aba):
+        self.latencia, self.contador, self.linhas_por_aba = latencia, contador, linhas_por_aba
+        self._abas, self._lock = {}, threading.Lock()
+
+    def get_worksheet_by_id(self, gid):
+        self.contador.registrar('sheets.get_worksheet_by_id')
+        time.sleep(self.latencia)
+        with self._lock:
+            if gid not in self._abas:
+                self._abas[gid] = WorksheetFalsa(f"Aba {gid}", self.latencia, self.contador, self.linhas_por_aba.get(gid))
+            return self._abas[gid]
+
+class GspreadFalso:
+    """Substitui o cliente do gspread; cada planilha aberta guarda suas abas em memória."""
+
+    def __init__(self, latencia=0.0, linhas_por_aba=None, cota_por_minuto=None):
+        self.latencia = latencia
+        self.contador = ContadorChamadas(cota_por_minuto)
+        self._linhas_por_aba = linhas_por_aba or {}
+        self._planilhas, self._lock = {}, threading.Lock()
+
+    def open_by_key(self, chave):
+        self.contador.registrar('sheets.open_by_key')
+        time.sleep(self.latencia)
+        with self._lock:
+            if chave not in self._planilhas: self._planilhas[chave] = PlanilhaFalsa(self.latencia, self.contador, self._linhas_por_aba)
+            return self._planilhas[chave]
+
+
+# --- GOOGLE DRIVE ---
+class _RequisicaoFalsa:
+    def __init__(self, executar):
+        self._executar = executar
+
+    def execute(self, *args, **kwargs):
+        return self._executar()
+
+class DriveFalso:
+    """Substitui o serviço do Drive (files().list / files().create); os arquivos ficam só como metadados em memória."""
+
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.contador = ContadorChamadas()
+        self.bytes_enviados = 0
+        self._arquivos, self._ids, self._lock = {}, itertools.count(1), threading.Lock()
+
+    def files(self):
+        return self
+
+    @staticmethod
+    def _termo(query, padrao):
+        encontrado = re.search(padrao + r"'((?:\\.|[^'\\])*)'", query)
+        return encontrado.group(1).replace("\\'", "'").replace("\\\\", "\\") if encontrado else None
+
+    def list(self, q='', fields=None, **kwargs):
+        def executar():
+            self.contador.registrar('drive.list')
+            time.sleep(self.latencia)
+            pasta = re.match(r"'([^']*)' in parents", q)
+            nome, contem, mimetype = self._termo(q, r"name = "), self._termo(q, r"name contains "), self._termo(q, r"mimeType = ")
+            with self._lock:
+                arquivos = [a for a in self._arquivos.values()
+                            if (not pasta or pasta.group(1) in a['parents']) and (nome is None or a['name'] == nome)
+                            and (contem is None or contem in a['name']) and (mimetype is None or a['mimeType'] == mimetype)]
+            return {'files': [dict(a) for a in arquivos]}
+        return _RequisicaoFalsa(executar)
+
+    def create(self, body=None, media_body=None, fields=None, **kwargs):
+        def executar():
+            self.contador.registrar('drive.create')
+            tamanho = 0
+            if media_body is not None:
+                tamanho = media_body.size()
+                media_body.getbytes(0, tamanho)
+            time.sleep(self.latencia)
+            with self._lock:
+                id_arquivo = f"arquivo-{next(self._ids)}"
+                self._arquivos[id_arquivo] = {'id': id_arquivo, 'name': body.get('name'), 'parents': body.get('parents', []),
+                                              'mimeType': body.get('mimeType', 'application/octet-stream')}
+                self.bytes_enviados += tamanho
+            return {'id': id_arquivo}
+        return _RequisicaoFalsa(executar)
+
+
+# --- CONTA AZUL ---
+def vendas_sinteticas(data_inicial, data_final, vendas_por_dia):
+    """Vendas determinísticas por dia, no formato devolvido pela API (cada uma com os seus produtos)."""
+    vendas, dia = [], data_inicial
+    while dia <= data_final:
+        for i in range(vendas_por_dia):
+            vendas.append({
+                'id': f"{dia.isoformat()}-{i}", 'emission': datetime.combine(dia, datetime.min.time()).replace(hour=8 + i % 12).isoformat(),
+                'products': [{'product': {'name': f"Produto {(i + j) % 40}"}, 'quantity': 1 + j, 'value': 5.0 + (i + j) % 30} for j in range(1 + i % 3)],
+            })
+        dia += timedelta(days=1)
+    return vendas
+
+class ServidorContaAzulFalso:
+    """Servidor HTTP local que responde GET /vendas com paginação (page/size), como a API do Conta Azul."""
+
+    def __init__(self, vendas_por_dia=50, latencia=0.0):
+        self.vendas_por_dia, self.latencia = vendas_por_dia, latencia
+        self.contador = ContadorChamadas()
+        servidor_falso = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {chave: valores[0] for chave, valores in parse_qs(url.query).items()}
+                servidor_falso.contador.registrar('conta_azul.vendas')
+                time.sleep(servidor_falso.latencia)
+                vendas = vendas_sinteticas(date.fromisoformat(params['data_inicial']), date.fromisoformat(params['data_final']), servidor_falso.vendas_por_dia)
+                pagina, tamanho = int(params.get('page', 0)), int(params.get('size', 100))
+                corpo = json.dumps({'items': vendas[pagina * tamanho:(pagina + 1) * tamanho]}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._servidor.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._servidor.server_address[1]}"
+        self._thread = threading.Thread(target=self._servidor.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._servidor.shutdown()
+        self._servidor.server_close()
@@ -0,0 +1,105 @@
+# backend/cache_ocr.py
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+# --- CONFIGURAÇÃO DO CACHE DE OCR ---
+OCR_CACHE_PASTA = os.path.abspath(os.getenv('OCR_CACHE_PASTA', 'ocr_cache'))
+OCR_CACHE_MAX_ITENS = int(os.getenv('OCR_CACHE_MAX_ITENS', '256'))
+OCR_CACHE_MAX_MB = float(os.getenv('OCR_CACHE_MAX_MB', '100'))
+
+
+class CacheOCR:
+    """
+    Cache dos resultados de OCR endereçado pelo conteúdo do arquivo e pela configuração usada na extração.
+    Tem duas camadas: LRU em memória (limitada em número de itens) e JSON em disco (limitada em tamanho,
+    removendo primeiro os arquivos acessados há mais tempo).
+    """
+
+    def __init__(self, pasta, max_itens_memoria, max_bytes_disco):
+        self.pasta = pasta
+        self.max_itens_memoria = max_itens_memoria
+        self.max_bytes_disco = max_bytes_disco
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = {'acertos_memoria': 0, 'acertos_disco': 0, 'falhas': 0, 'remocoes_disco': 0}
+        os.makedirs(self.pasta, exist_ok=True)
+        self._bytes_disco = sum(e.stat().st_size for e in os.scandir(self.pasta) if e.name.endswith('.json'))
+
+    def chave(self, hash_conteudo, configuracao):
+        # A configuração entra na chave para que uma mudança de DPI, idioma ou regra de análise invalide o cache.
+        config_str = json.dumps(configuracao, sort_keys=True, default=str)
+        return hashlib.sha256(f"{hash_conteudo}|{config_str}".encode('utf-8')).hexdigest()
+
+    def _caminho_disco(self, chave):
+        return os.path.join(self.pasta, f"{chave}.json")
+
+    def obter(self, chave):
+        with self._lock:
+            if chave in self._memoria:
+                self._memoria.move_to_end(chave)
+                self._contadores['acertos_memoria'] += 1
+                return dict(self._memoria[chave])
+        caminho = self._caminho_disco(chave)
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                valor = json.load(f)
+            os.utime(caminho)
+        except (OSError, ValueError):
+            with self._lock: self._contadores['falhas'] += 1
+            return None
+        with self._lock:
+            self._contadores['acertos_disco'] += 1
+            self._guardar_memoria(chave, valor)
+        return dict(valor)
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._guardar_memoria(chave, valor)
+        caminho = self._caminho_disco(chave)
+        temporario = f"{caminho}.{threading.get_ident()}.tmp"
+        try:
+            tamanho_anterior = os.path.getsize(caminho) if os.path.exists(caminho) else 0
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(valor, f, ensure_ascii=False)
+            os.replace(temporario, caminho)
+            with self._lock:
+                self._bytes_disco += os.path.getsize(caminho) - tamanho_anterior
+                excedeu = self._bytes_disco > self.max_bytes_disco
+            if excedeu: self._despejar_disco()
+        except OSError as e:
+            logging.warning(f"Não foi possível gravar o cache de OCR em disco: {e}")
+
+    def _guardar_memoria(self, chave, valor):
+        self._memoria[chave] = dict(valor)
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_itens_memoria:
+            self._memoria.popitem(last=False)
+
+    def _despejar_disco(self):
+        # Remove os arquivos menos usados recentemente até o cache voltar a 90% do limite.
+        entradas = sorted((e for e in os.scandir(self.pasta) if e.name.endswith('.json')), key=lambda e: e.stat().st_mtime)
+        total = sum(e.stat().st_size for e in entradas)
+        removidos = 0
+        for entrada in entradas:
+            if total <= self.max_bytes_disco * 0.9: break
+            try:
+                tamanho = entrada.stat().st_size
+                os.remove(entrada.path)
+                total -= tamanho
+                removidos += 1
+            except OSError: pass
+        with self._lock:
+            self._bytes_disco = total
+            self._contadores['remocoes_disco'] += removidos
+
+    def estatisticas(self):
+        with self._lock:
+            return dict(self._contadores, itens_memoria=len(self._memoria), bytes_disco=self._bytes_disco)
+
+
+cache_ocr = CacheOCR(OCR_CACHE_PASTA, OCR_CACHE_MAX_ITENS, int(OCR_CACHE_MAX_MB * 1024 * 1024))
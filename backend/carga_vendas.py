@@ -0,0 +1,125 @@
+# backend/carga_vendas.py
+
+import logging
+import os
+from datetime import datetime, timedelta
+from itertools import islice
+
+from sqlalchemy import Date, and_, cast, delete, func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import engine
+from models import Venda, VendaDiaria
+
+# Quantidade de registros gravados por transação
+CARGA_VENDAS_TAMANHO_LOTE = int(os.getenv("CARGA_VENDAS_TAMANHO_LOTE", "1000"))
+
+COLUNAS_ATUALIZAVEIS = ('produto', 'quantidade', 'valor_unitario', 'valor_total', 'data_venda', 'origem')
+
+_INSERT_POR_DIALETO = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def _normalizar(registro):
+    # Devolve o dicionário pronto para a tabela `vendas`, ou None se o registro não puder ser gravado.
+    id_externo = registro.get('id_externo')
+    if id_externo in (None, ''): return None
+    data_venda = registro.get('data_venda')
+    if isinstance(data_venda, str):
+        try:
+            data_venda = datetime.fromisoformat(data_venda)
+        except ValueError:
+            return None
+    linha = {coluna: registro.get(coluna) for coluna in COLUNAS_ATUALIZAVEIS}
+    linha.update({'id_externo': str(id_externo), 'data_venda': data_venda})
+    return linha
+
+def _lotes(registros, tamanho_lote):
+    iterador = iter(registros)
+    while True:
+        lote = list(islice(iterador, tamanho_lote))
+        if not lote: return
+        yield lote
+
+def carregar_vendas(registros, tamanho_lote=CARGA_VENDAS_TAMANHO_LOTE, bind=None):
+    """
+    Grava um fluxo de registros de venda (dicionários com as colunas de `Venda`) em lotes, com upsert nativo
+    pelo `id_externo` (ON CONFLICT no PostgreSQL e no SQLite), uma transação por lote. Só um lote fica em memória.
+    Linhas que já existem com os mesmos valores não são reescritas.
+    Devolve {'inseridos', 'atualizados', 'ignorados', 'dias'}, onde `dias` são as datas com vendas novas ou alteradas
+    (incluindo a data antiga de uma venda que mudou de dia), para `atualizar_resumos_diarios`.
+    """
+    bind = bind or engine
+    insert = _INSERT_POR_DIALETO.get(bind.dialect.name)
+    if insert is None: raise NotImplementedError(f"Upsert de vendas não suportado para o banco '{bind.dialect.name}'.")
+    tabela = Venda.__table__
+    # A instrução é montada uma vez e executada com a lista de parâmetros de cada lote (executemany): o SQLAlchemy
+    # a compila uma única vez e agrupa as linhas em INSERTs de múltiplos VALUES. O RETURNING só traz as linhas
+    # realmente inseridas ou alteradas, pois o WHERE do ON CONFLICT descarta as que vieram iguais.
+    instrucao = insert(tabela)
+    excluido = instrucao.excluded
+    instrucao = instrucao.on_conflict_do_update(
+        index_elements=[tabela.c.id_externo],
+        set_={coluna: excluido[coluna] for coluna in COLUNAS_ATUALIZAVEIS},
+        where=or_(*(tabela.c[coluna].is_distinct_from(excluido[coluna]) for coluna in COLUNAS_ATUALIZAVEIS)),
+    ).returning(tabela.c.id_externo, tabela.c.data_venda)
+    resumo = {'inseridos': 0, 'atualizados': 0, 'ignorados': 0, 'dias': set()}
+
+    for numero_lote, lote in enumerate(_lotes(registros, tamanho_lote), start=1):
+        # Registros inválidos são ignorados; se o mesmo id_externo aparece duas vezes no lote, vale o último.
+        linhas = {}
+        for registro in lote:
+            linha = _normalizar(registro)
+            if linha is None or linha['id_externo'] in linhas: resumo['ignorados'] += 1
+            if linha is not None: linhas[linha['id_externo']] = linha
+        if not linhas: continue
+
+        with bind.begin() as conexao:
+            existentes = dict(conexao.execute(select(tabela.c.id_externo, tabela.c.data_venda).where(tabela.c.id_externo.in_(list(linhas)))).all())
+            afetadas = conexao.execute(instrucao, list(linhas.values())).all()
+
+        for id_externo, data_venda in afetadas:
+            for data in (data_venda, existentes.get(id_externo)):
+                if data is not None: resumo['dias'].add(data.date())
+        inseridos = len(linhas) - len(existentes)
+        atualizados = len(afetadas) - inseridos
+        resumo['inseridos'] += inseridos
+        resumo['atualizados'] += atualizados
+        resumo['ignorados'] += len(existentes) - atualizados
+        logging.info(f"Lote {numero_lote} de vendas: {inseridos} inserida(s), {atualizados} atualizada(s).")
+
+    return resumo
+
+def _intervalos(dias):
+    # Agrupa dias consecutivos em intervalos [início, fim) para filtrar `data_venda` usando o índice.
+    intervalos = []
+    for dia in sorted(dias):
+        if intervalos and intervalos[-1][1] == dia:
+            intervalos[-1][1] = dia + timedelta(days=1)
+        else:
+            intervalos.append([dia, dia + timedelta(days=1)])
+    return intervalos
+
+def atualizar_resumos_diarios(dias=None, bind=None):
+    """
+    Recalcula a tabela `vendas_diarias` (total, número de vendas e preço médio por dia, produto e origem)
+    apenas para os `dias` informados, numa única transação. Sem `dias`, reconstrói o resumo inteiro.
+    """
+    bind = bind or engine
+    vendas, resumos = Venda.__table__, VendaDiaria.__table__
+    if dias is not None and not dias: return
+    # No SQLite, CAST(... AS DATE) não gera uma data; date() devolve o 'AAAA-MM-DD' que o tipo Date espera.
+    dia = func.date(vendas.c.data_venda) if bind.dialect.name == 'sqlite' else cast(vendas.c.data_venda, Date)
+    agregado = select(dia, vendas.c.produto, vendas.c.origem, func.sum(vendas.c.valor_total), func.count(), func.avg(vendas.c.valor_unitario)) \
+        .where(vendas.c.data_venda.is_not(None)).group_by(dia, vendas.c.produto, vendas.c.origem)
+    remocao = delete(resumos)
+    if dias is not None:
+        intervalos = _intervalos(dias)
+        agregado = agregado.where(or_(*(and_(vendas.c.data_venda >= datetime.combine(inicio, datetime.min.time()),
+                                             vendas.c.data_venda < datetime.combine(fim, datetime.min.time()))
+                                        for inicio, fim in intervalos)))
+        remocao = remocao.where(or_(*(resumos.c.data.between(inicio, fim - timedelta(days=1)) for inicio, fim in intervalos)))
+    with bind.begin() as conexao:
+        conexao.execute(remocao)
+        conexao.execute(resumos.insert().from_select(
+            ['data', 'produto', 'origem', 'valor_total', 'quantidade_vendas', 'preco_medio'], agregado))
+    logging.info(f"Resumos diários de vendas atualizados ({len(dias)} dia(s))." if dias is not None else "Resumos diários de vendas reconstruídos.")
@@ -0,0 +1,141 @@
+# backend/clientes_google.py
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+# --- CONFIGURAÇÃO DAS CREDENCIAIS DO GOOGLE ---
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
+CLIENT_SECRET_FILE = 'client_secret.json'
+TOKEN_FILE = 'token.json'
+# O token é renovado quando faltar menos do que isto (em segundos) para expirar, e não a cada chamada.
+GOOGLE_MARGEM_RENOVACAO = int(os.getenv('GOOGLE_MARGEM_RENOVACAO', '300'))
+COMANDO_AUTORIZACAO = 'flask --app app autorizar-google'
+
+
+class CredenciaisGoogleAusentes(Exception):
+    """Não há token válido nem renovável: o acesso precisa ser autorizado uma vez pelo comando `autorizar-google`."""
+
+
+class ProvedorClientesGoogle:
+    """
+    Cria sob demanda, uma única vez por processo, as credenciais OAuth e os clientes do Sheets (gspread) e do Drive.
+    Nada é feito na importação: a primeira operação do Google carrega o token, e o Drive é montado com o documento
+    de descoberta que vem no pacote (sem ir à rede). Os clientes são compartilhados entre as threads das requisições;
+    no Drive cada thread usa a sua própria conexão HTTP, pois o httplib2 não é thread-safe.
+    O login interativo nunca roda aqui: numa requisição ou num job ele travaria à espera do navegador. Sem token
+    válido a operação falha com CredenciaisGoogleAusentes, e o acesso é autorizado uma vez com `autorizar`.
+    """
+
+    def __init__(self, arquivo_token, arquivo_segredo, scopes, margem_renovacao):
+        self.arquivo_token = arquivo_token
+        self.arquivo_segredo = arquivo_segredo
+        self.scopes = scopes
+        self.margem_renovacao = timedelta(seconds=margem_renovacao)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._creds = self._gspread = self._drive = None
+
+    def _carregar_credenciais(self):
+        from google.auth.exceptions import RefreshError
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+
+        if not os.path.exists(self.arquivo_token):
+            raise CredenciaisGoogleAusentes(f"'{self.arquivo_token}' não existe. Autorize o acesso ao Google com `{COMANDO_AUTORIZACAO}`.")
+        creds = Credentials.from_authorized_user_file(self.arquivo_token, self.scopes)
+        if not creds.valid:
+            if not (creds.expired and creds.refresh_token):
+                raise CredenciaisGoogleAusentes(f"O token em '{self.arquivo_token}' é inválido. Autorize o acesso ao Google com `{COMANDO_AUTORIZACAO}`.")
+            try:
+                creds.refresh(Request())
+            except RefreshError as e:
+                raise CredenciaisGoogleAusentes(f"O token do Google foi revogado ou expirou ({e}). Autorize o acesso com `{COMANDO_AUTORIZACAO}`.") from e
+            self._salvar_token(creds)
+        logging.info("Credenciais do Google (OAuth 2.0) carregadas com sucesso.")
+        return creds
+
+    def autorizar(self, porta=8080):
+        """Login interativo no navegador (só pelo comando `autorizar-google`): grava o token e passa a usá-lo."""
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        flow = InstalledAppFlow.from_client_secrets_file(self.arquivo_segredo, self.scopes)
+        creds = flow.run_local_server(port=porta)
+        self._salvar_token(creds)
+        self.definir(creds=creds)
+        logging.info(f"Acesso ao Google autorizado; token gravado em '{self.arquivo_token}'.")
+        return creds
+
+    def _salvar_token(self, creds):
+        with open(self.arquivo_token, 'w') as token:
+            token.write(creds.to_json())
+
+    def _renovar_se_necessario(self):
+        # Chamado com o lock adquirido: só uma thread renova, as demais aguardam e reutilizam o token novo.
+        creds = self._creds
+        if creds.expiry is None or not creds.refresh_token: return
+        if creds.expiry - datetime.utcnow() > self.margem_renovacao: return
+        from google.auth.transport.requests import Request
+        creds.refresh(Request())
+        self._salvar_token(creds)
+        logging.info("Token do Google renovado antes de expirar.")
+
+    def credenciais(self):
+        with self._lock:
+            if self._creds is None:
+                self._creds = self._carregar_credenciais()
+            else:
+                self._renovar_se_necessario()
+            return self._creds
+
+    def disponivel(self):
+        try:
+            if self._gspread is not None and self._drive is not None: return True
+            return self.credenciais() is not None
+        except CredenciaisGoogleAusentes as e:
+            logging.error(f"ERRO CRÍTICO ao carregar credenciais do Google: {e}")
+            return False
+        except Exception as e:
+            logging.error(f"ERRO CRÍTICO ao carregar credenciais do Google: {e}", exc_info=True)
+            return False
+
+    def gspread(self):
+        with self._lock:
+            if self._gspread is None:
+                import gspread
+                self._gspread = gspread.authorize(self.credenciais())
+            elif self._creds is not None:
+                self._renovar_se_necessario()
+            return self._gspread
+
+    def _http_da_thread(self):
+        import google_auth_httplib2
+        import httplib2
+        http = getattr(self._local, 'http', None)
+        if http is None or http.credentials is not self._creds:
+            http = self._local.http = google_auth_httplib2.AuthorizedHttp(self._creds, http=httplib2.Http())
+        return http
+
+    def _construir_requisicao(self, http, *args, **kwargs):
+        from googleapiclient.http import HttpRequest
+        return HttpRequest(self._http_da_thread(), *args, **kwargs)
+
+    def drive(self):
+        with self._lock:
+            if self._drive is None:
+                import google_auth_httplib2
+                import httplib2
+                from googleapiclient.discovery import build
+                http = google_auth_httplib2.AuthorizedHttp(self.credenciais(), http=httplib2.Http())
+                self._drive = build('drive', 'v3', http=http, requestBuilder=self._construir_requisicao, static_discovery=True)
+            elif self._creds is not None:
+                self._renovar_se_necessario()
+            return self._drive
+
+    def definir(self, creds=None, gspread_client=None, drive_service=None):
+        """Substitui os clientes (ex.: por versões falsas em benchmarks). Os que não forem informados são recriados sob demanda."""
+        with self._lock:
+            self._creds, self._gspread, self._drive = creds, gspread_client, drive_service
+
+
+clientes_google = ProvedorClientesGoogle(TOKEN_FILE, CLIENT_SECRET_FILE, SCOPES, GOOGLE_MARGEM_RENOVACAO)
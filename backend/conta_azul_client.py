@@ -1,26 +1,160 @@
 # backend/conta_azul_client.py
-import requests
+import json
+import logging
 import os
-from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Pega a chave da API do arquivo .env
 API_KEY = os.getenv("CONTA_AZUL_API_KEY")
-BASE_URL = "https://api.contaazul.com/v1"
+BASE_URL = os.getenv("CONTA_AZUL_BASE_URL", "https://api.contaazul.com/v1")
+
+# --- CONFIGURAÇÃO DA SINCRONIZAÇÃO ---
+CONTA_AZUL_TAMANHO_PAGINA = int(os.getenv("CONTA_AZUL_TAMANHO_PAGINA", "100"))
+CONTA_AZUL_MAX_WORKERS = int(os.getenv("CONTA_AZUL_MAX_WORKERS", "4"))
+CONTA_AZUL_DIAS_POR_BLOCO = int(os.getenv("CONTA_AZUL_DIAS_POR_BLOCO", "7"))
+CONTA_AZUL_TENTATIVAS = int(os.getenv("CONTA_AZUL_TENTATIVAS", "5"))
+CONTA_AZUL_TIMEOUT = float(os.getenv("CONTA_AZUL_TIMEOUT", "30"))
+CONTA_AZUL_CURSOR_FILE = os.path.abspath(os.getenv("CONTA_AZUL_CURSOR_FILE", "conta_azul_cursor.json"))
+# A API de vendas só filtra pela data de emissão, não pela data de alteração: cada sincronização volta estes dias
+# antes do cursor para pegar vendas editadas depois do dia em que foram emitidas. Também é o período buscado na
+# primeira sincronização (sem cursor); períodos mais antigos são carregados com `flask sincronizar-vendas`.
+CONTA_AZUL_DIAS_REVISAO = int(os.getenv("CONTA_AZUL_DIAS_REVISAO", "7"))
+
+
+class ClienteContaAzul:
+    """
+    Cliente de sincronização com o Conta Azul: uma Session com pool de conexões, paginação automática,
+    períodos longos divididos em blocos buscados em paralelo e novas tentativas com backoff em 429/5xx.
+    O `base_url` pode apontar para um servidor HTTP local de testes.
+    """
+
+    def __init__(self, base_url=BASE_URL, api_key=API_KEY, tamanho_pagina=CONTA_AZUL_TAMANHO_PAGINA,
+                 max_workers=CONTA_AZUL_MAX_WORKERS, dias_por_bloco=CONTA_AZUL_DIAS_POR_BLOCO,
+                 tentativas=CONTA_AZUL_TENTATIVAS, timeout=CONTA_AZUL_TIMEOUT, arquivo_cursor=CONTA_AZUL_CURSOR_FILE,
+                 dias_revisao=CONTA_AZUL_DIAS_REVISAO):
+        self.base_url = base_url.rstrip('/')
+        self.tamanho_pagina = tamanho_pagina
+        self.max_workers = max_workers
+        self.dias_por_bloco = dias_por_bloco
+        self.timeout = timeout
+        self.arquivo_cursor = arquivo_cursor
+        self.dias_revisao = dias_revisao
+
+        # O Retry do urllib3 respeita o cabeçalho Retry-After e aplica backoff exponencial entre as tentativas.
+        retry = Retry(total=tentativas, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']), respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'Authorization': f'Bearer {api_key}'})
+
+    def _buscar_pagina(self, data_inicial, data_final, pagina):
+        params = {'data_inicial': data_inicial.strftime('%Y-%m-%d'), 'data_final': data_final.strftime('%Y-%m-%d'),
+                  'page': pagina, 'size': self.tamanho_pagina}
+        response = self.session.get(f"{self.base_url}/vendas", params=params, timeout=self.timeout)
+        response.raise_for_status() # Lança um erro para respostas 4xx ou 5xx (após as novas tentativas)
+        itens = response.json()
+        return itens.get('items', []) if isinstance(itens, dict) else itens
+
+    def _buscar_bloco(self, data_inicial, data_final):
+        vendas, pagina = [], 0
+        while True:
+            itens = self._buscar_pagina(data_inicial, data_final, pagina)
+            vendas.extend(itens)
+            if len(itens) < self.tamanho_pagina: return vendas
+            pagina += 1
+
+    def _blocos(self, data_inicial, data_final):
+        inicio = data_inicial
+        while inicio <= data_final:
+            fim = min(inicio + timedelta(days=self.dias_por_bloco - 1), data_final)
+            yield inicio, fim
+            inicio = fim + timedelta(days=1)
+
+    def vendas_do_periodo(self, data_inicial: date, data_final: date):
+        """
+        Busca todas as vendas entre as duas datas (inclusive). O período é dividido em blocos de
+        `dias_por_bloco` dias, buscados em paralelo; o resultado mantém a ordem cronológica dos blocos.
+        """
+        blocos = list(self._blocos(data_inicial, data_final))
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            resultados = list(executor.map(lambda bloco: self._buscar_bloco(*bloco), blocos))
+        vendas = [venda for resultado in resultados for venda in resultado]
+        logging.info(f"Conta Azul: {len(vendas)} venda(s) entre {data_inicial} e {data_final} em {len(blocos)} bloco(s).")
+        return vendas
+
+    # --- CURSOR INCREMENTAL ---
+    def ler_cursor(self):
+        try:
+            with open(self.arquivo_cursor, 'r', encoding='utf-8') as f:
+                return date.fromisoformat(json.load(f)['ultima_data'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def salvar_cursor(self, ultima_data: date):
+        temporario = f"{self.arquivo_cursor}.tmp"
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump({'ultima_data': ultima_data.isoformat(), 'atualizado_em': datetime.now().isoformat(timespec='seconds')}, f)
+        os.replace(temporario, self.arquivo_cursor)
+
+    def vendas_desde_cursor(self, hoje: date = None):
+        """
+        Busca as vendas desde a última sincronização, voltando `dias_revisao` dias antes do cursor (ou de hoje, na
+        primeira vez). Devolve (vendas, nova_data_cursor); o cursor só deve ser salvo depois que as vendas forem gravadas.
+
+        Limitação: como a API não informa a data de alteração, uma venda editada mais de `dias_revisao` dias depois
+        da emissão não é buscada de novo, e uma venda cancelada que some da API continua gravada. Para corrigir um
+        período antigo, basta recarregá-lo com `vendas_do_periodo` (comando `flask sincronizar-vendas`).
+        """
+        hoje = hoje or date.today()
+        inicio = min(self.ler_cursor() or hoje, hoje) - timedelta(days=self.dias_revisao)
+        return self.vendas_do_periodo(inicio, hoje), hoje
+
+
+cliente_conta_azul = ClienteContaAzul()
+
+
+def registros_venda(vendas, origem='conta_azul'):
+    """
+    Converte as vendas da API em registros da tabela `vendas` (um por item vendido), sob demanda,
+    para serem gravados em lote por `carga_vendas.carregar_vendas`.
+    """
+    for venda in vendas:
+        itens = venda.get('products') or venda.get('itens')
+        data_venda = venda.get('emission') or venda.get('data_venda')
+        for posicao, item in enumerate(itens or [venda]):
+            quantidade = item.get('quantity', item.get('quantidade'))
+            valor_unitario = item.get('value', item.get('valor_unitario'))
+            valor_total = item.get('total', item.get('valor_total'))
+            if valor_total is None and quantidade is not None and valor_unitario is not None:
+                valor_total = quantidade * valor_unitario
+            produto = item.get('product') or item.get('produto')
+            yield {
+                'id_externo': f"{venda.get('id')}:{posicao}" if itens else venda.get('id'),
+                'produto': produto.get('name') if isinstance(produto, dict) else produto,
+                'quantidade': quantidade,
+                'valor_unitario': valor_unitario,
+                'valor_total': valor_total,
+                'data_venda': data_venda,
+                'origem': origem,
+            }
+
 
 def get_vendas_do_dia(data_busca: date):
     """
     Busca as vendas de um dia específico na API do Conta Azul.
     """
-    headers = {'Authorization': f'Bearer {API_KEY}'}
-    params = {'data_inicial': data_busca.strftime('%Y-%m-%d'), 'data_final': data_busca.strftime('%Y-%m-%d')}
-
     try:
-        response = requests.get(f"{BASE_URL}/vendas", headers=headers, params=params)
-        response.raise_for_status() # Lança um erro para respostas 4xx ou 5xx
-        return response.json()
+        return cliente_conta_azul.vendas_do_periodo(data_busca, data_busca)
     except requests.exceptions.RequestException as e:
         print(f"Erro ao buscar vendas no Conta Azul: {e}")
         return None
 
 # Você criaria funções similares para buscar produtos, clientes, etc.
-# E também funções para ENVIAR dados (POST, PUT).
\ No newline at end of file
+# E também funções para ENVIAR dados (POST, PUT).
@@ -0,0 +1,143 @@
+# backend/documentos.py
+
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+# --- CONFIGURAÇÃO DOS DOCUMENTOS RECEBIDOS ---
+# Arquivos até este tamanho ficam só em memória; os maiores vão para um arquivo temporário com nome único.
+DOCUMENTO_LIMITE_MEMORIA = int(os.getenv('DOCUMENTO_LIMITE_MEMORIA', str(8 * 1024 * 1024)))
+
+_TAMANHO_BLOCO = 1024 * 1024
+
+
+class ArquivoRecebido:
+    """
+    Destino em que o Werkzeug grava um arquivo do formulário multipart (ver `_get_file_stream` no app). Guarda os
+    bytes em memória até `limite_memoria` e, acima disso, passa a gravar direto num arquivo com nome único em
+    `pasta`, calculando o hash enquanto recebe. `DocumentoEnviado.de_recebido` adota o conteúdo sem copiá-lo;
+    um arquivo nunca adotado é apagado quando o Werkzeug fecha o stream no fim da requisição.
+    """
+
+    def __init__(self, limite_memoria, pasta=None, sufixo=''):
+        self.limite_memoria = limite_memoria
+        self.pasta = pasta
+        self.sufixo = sufixo
+        self.sha = hashlib.sha256()
+        self._arquivo = io.BytesIO()
+        self._em_disco = self._adotado = False
+
+    def write(self, bloco):
+        if not self._em_disco and self._arquivo.tell() + len(bloco) > self.limite_memoria:
+            arquivo = tempfile.NamedTemporaryFile(delete=False, dir=self.pasta, prefix='upload-', suffix=self.sufixo)
+            arquivo.write(self._arquivo.getbuffer())
+            self._arquivo, self._em_disco = arquivo, True
+        self.sha.update(bloco)
+        return self._arquivo.write(bloco)
+
+    def read(self, tamanho=-1):
+        return self._arquivo.read(tamanho)
+
+    def seek(self, posicao, origem=0):
+        return self._arquivo.seek(posicao, origem)
+
+    def tell(self):
+        return self._arquivo.tell()
+
+    def readable(self): return True
+    def writable(self): return True
+    def seekable(self): return True
+
+    def adotar(self):
+        """Entrega (conteúdo em bytes ou None, caminho ou None, sha256) e deixa de ser dono do arquivo em disco."""
+        self._adotado = True
+        if self._em_disco:
+            self._arquivo.close()
+            return None, self._arquivo.name, self.sha.hexdigest()
+        # getvalue() devolve os bytes do próprio buffer, sem nova cópia.
+        return self._arquivo.getvalue(), None, self.sha.hexdigest()
+
+    def close(self):
+        self._arquivo.close()
+        if self._em_disco and not self._adotado:
+            try: os.remove(self._arquivo.name)
+            except OSError: pass
+
+    @property
+    def closed(self):
+        return self._arquivo.closed
+
+
+class DocumentoEnviado:
+    """
+    Um arquivo recebido do frontend. O mesmo conteúdo alimenta o OCR e o upload ao Drive sem novas cópias:
+    `abrir()` devolve um leitor novo sobre os bytes em memória (ou sobre o arquivo temporário, se foi grande demais).
+    """
+
+    def __init__(self, nome, conteudo=None, caminho=None, sha256=None, temporario=False):
+        self.nome = nome
+        self.conteudo = conteudo          # bytes, quando o documento está em memória
+        self.caminho = caminho            # caminho em disco, quando não está
+        self._sha256 = sha256
+        self._temporario = temporario
+
+    @classmethod
+    def de_recebido(cls, nome, stream, pasta_temporaria=None):
+        # O caminho normal do app: o Werkzeug já gravou o upload num ArquivoRecebido, que é adotado sem cópia.
+        if isinstance(stream, ArquivoRecebido):
+            conteudo, caminho, sha256 = stream.adotar()
+            return cls(nome, conteudo=conteudo, caminho=caminho, sha256=sha256, temporario=caminho is not None)
+        return cls.de_stream(nome, stream, pasta_temporaria=pasta_temporaria)
+
+    @classmethod
+    def de_stream(cls, nome, stream, limite_memoria=DOCUMENTO_LIMITE_MEMORIA, pasta_temporaria=None):
+        # Lê o upload uma única vez, calculando o hash no caminho; só passa para o disco se exceder o limite.
+        sha = hashlib.sha256()
+        buffer, arquivo = io.BytesIO(), None
+        try:
+            for bloco in iter(lambda: stream.read(_TAMANHO_BLOCO), b''):
+                sha.update(bloco)
+                if arquivo is None and buffer.tell() + len(bloco) > limite_memoria:
+                    arquivo = tempfile.NamedTemporaryFile(delete=False, dir=pasta_temporaria, prefix='upload-', suffix=Path(nome).suffix)
+                    arquivo.write(buffer.getbuffer())
+                    buffer = None
+                (arquivo if arquivo is not None else buffer).write(bloco)
+        except Exception:
+            if arquivo is not None:
+                arquivo.close()
+                os.remove(arquivo.name)
+            raise
+        if arquivo is not None:
+            arquivo.close()
+            return cls(nome, caminho=arquivo.name, sha256=sha.hexdigest(), temporario=True)
+        return cls(nome, conteudo=buffer.getvalue(), sha256=sha.hexdigest())
+
+    @property
+    def tamanho(self):
+        return len(self.conteudo) if self.conteudo is not None else os.path.getsize(self.caminho)
+
+    @property
+    def sha256(self):
+        if self._sha256 is None:
+            sha = hashlib.sha256()
+            with self.abrir() as f:
+                for bloco in iter(lambda: f.read(_TAMANHO_BLOCO), b''): sha.update(bloco)
+            self._sha256 = sha.hexdigest()
+        return self._sha256
+
+    def existe(self):
+        return self.conteudo is not None or (self.caminho is not None and os.path.exists(self.caminho))
+
+    def abrir(self):
+        # BytesIO sobre um objeto bytes compartilha a memória em vez de copiá-la.
+        return io.BytesIO(self.conteudo) if self.conteudo is not None else open(self.caminho, 'rb')
+
+    def descartar(self):
+        if self._temporario and self.caminho:
+            try: os.remove(self.caminho)
+            except FileNotFoundError: pass
+            except OSError as e: logging.error(f"Erro ao remover o arquivo temporário de '{self.nome}': {e}")
+        self.conteudo = None
@@ -0,0 +1,304 @@
+# backend/fila_jobs.py
+
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from documentos import DocumentoEnviado
+from metricas import metricas
+
+# --- CONFIGURAÇÃO DA FILA DE JOBS ---
+JOBS_DB = os.path.abspath(os.getenv('JOBS_DB', 'jobs.db'))
+JOBS_MAX_WORKERS = int(os.getenv('JOBS_MAX_WORKERS', '2'))
+# Intervalo (segundos) em que os workers consultam o banco mesmo sem aviso, para pegar jobs de outros processos.
+JOBS_INTERVALO_CONSULTA = float(os.getenv('JOBS_INTERVALO_CONSULTA', '5'))
+# Um job em execução pertence ao processo que o pegou enquanto este renovar o prazo (lease); se o processo morrer,
+# o job volta para a fila quando o prazo vencer.
+JOBS_LEASE_SEGUNDOS = float(os.getenv('JOBS_LEASE_SEGUNDOS', '60'))
+# Jobs finalizados há mais que isto (e os anexos órfãos) são apagados do banco.
+JOBS_RETENCAO_DIAS = float(os.getenv('JOBS_RETENCAO_DIAS', '7'))
+
+PENDENTE, EXECUTANDO, CONCLUIDO, ERRO = 'PENDENTE', 'EXECUTANDO', 'CONCLUIDO', 'ERRO'
+
+
+class ConflitoIdempotencia(Exception):
+    """A chave de idempotência já foi usada por uma requisição com outro conteúdo."""
+
+
+def _agora():
+    return datetime.now().isoformat(timespec='seconds')
+
+def _dono():
+    # Calculado a cada uso: com o gunicorn, o processo que importou o módulo não é o que executa os jobs.
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class FilaJobs:
+    """
+    Fila de jobs em segundo plano persistida em SQLite. Os endpoints enfileiram o trabalho e respondem na hora;
+    um pool de threads executa os jobs e grava progresso e resultado. Jobs que estavam na fila ou em execução
+    quando o processo parou voltam para a fila: cada job em execução tem um dono (host:pid) e um prazo renovado
+    enquanto ele roda, e só jobs com o prazo vencido são devolvidos à fila, nunca os que outro processo está executando.
+
+    Os documentos de cada job são entregues ao worker direto da memória. Para sobreviverem a um reinício, os que
+    estão em memória são gravados uma vez na tabela `anexos`; dos que já estão em disco guarda-se só o caminho.
+    """
+
+    def __init__(self, caminho_db, max_workers):
+        self.caminho_db = caminho_db
+        self.max_workers = max_workers
+        self._handlers = {}
+        self._threads = []
+        self._lock = threading.Lock()
+        self._condicao = threading.Condition()
+        self._documentos = {}   # job_id -> [DocumentoEnviado] dos jobs enfileirados por este processo
+        self._em_execucao = set()
+        self._criar_tabela()
+
+    @contextmanager
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho_db, timeout=30, isolation_level=None)
+        conexao.row_factory = sqlite3.Row
+        # Com WAL, NORMAL dispensa o fsync a cada commit (só nos checkpoints): enfileirar e atualizar o progresso
+        # não esperam o disco, e uma queda de energia perde no máximo as últimas transações, nunca corrompe o banco.
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        try:
+            yield conexao
+        finally:
+            conexao.close()
+
+    def _criar_tabela(self):
+        with self._conectar() as conexao:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            # Numa transação só: processos que sobem juntos não tentam criar a mesma coluna duas vezes.
+            conexao.execute("BEGIN IMMEDIATE")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY, tipo TEXT NOT NULL, status TEXT NOT NULL,
+                    progresso INTEGER NOT NULL DEFAULT 0, mensagem TEXT, parametros TEXT NOT NULL, resultado TEXT,
+                    criado_em TEXT NOT NULL, atualizado_em TEXT NOT NULL
+                )""")
+            colunas = {linha['name'] for linha in conexao.execute("PRAGMA table_info(jobs)")}
+            if 'dono' not in colunas: conexao.execute("ALTER TABLE jobs ADD COLUMN dono TEXT")
+            if 'lease_ate' not in colunas: conexao.execute("ALTER TABLE jobs ADD COLUMN lease_ate REAL")
+            if 'chave_idempotencia' not in colunas: conexao.execute("ALTER TABLE jobs ADD COLUMN chave_idempotencia TEXT")
+            if 'impressao' not in colunas: conexao.execute("ALTER TABLE jobs ADD COLUMN impressao TEXT")
+            conexao.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_jobs_chave_idempotencia ON jobs (chave_idempotencia) WHERE chave_idempotencia IS NOT NULL")
+            conexao.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_criado_em ON jobs (status, criado_em)")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS anexos (
+                    job_id TEXT NOT NULL, ordem INTEGER NOT NULL, nome TEXT NOT NULL, sha256 TEXT,
+                    conteudo BLOB, caminho TEXT, PRIMARY KEY (job_id, ordem)
+                )""")
+            conexao.execute("COMMIT")
+
+    def registrar(self, tipo, funcao):
+        """Registra a função que executa os jobs de `tipo`: funcao(parametros, documentos, progresso) -> dict de resultado."""
+        self._handlers[tipo] = funcao
+
+    def iniciar(self):
+        with self._lock:
+            if self._threads: return
+            for i in range(self.max_workers):
+                thread = threading.Thread(target=self._executar, name=f'job-worker-{i + 1}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._manter, name='job-manutencao', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            logging.info(f"Fila de jobs iniciada com {self.max_workers} worker(s) em '{self.caminho_db}'.")
+
+    def _manter(self):
+        # Renova o prazo dos jobs em execução neste processo; de hora em hora, limpa o banco e os documentos esquecidos.
+        proxima_limpeza = 0
+        while True:
+            try:
+                ids = list(self._em_execucao)
+                if ids:
+                    with self._conectar() as conexao:
+                        conexao.execute(f"UPDATE jobs SET lease_ate = ? WHERE dono = ? AND status = ? AND id IN ({','.join('?' * len(ids))})",
+                                        (time.time() + JOBS_LEASE_SEGUNDOS, _dono(), EXECUTANDO, *ids))
+                if time.monotonic() >= proxima_limpeza:
+                    self._limpar()
+                    proxima_limpeza = time.monotonic() + 3600
+            except Exception as e:
+                logging.error(f"Erro na manutenção da fila de jobs: {e}", exc_info=True)
+            time.sleep(JOBS_LEASE_SEGUNDOS / 3)
+
+    def _limpar(self):
+        limite = (datetime.now() - timedelta(days=JOBS_RETENCAO_DIAS)).isoformat(timespec='seconds')
+        with self._conectar() as conexao:
+            apagados = conexao.execute("DELETE FROM jobs WHERE status IN (?, ?) AND atualizado_em < ?", (CONCLUIDO, ERRO, limite)).rowcount
+            conexao.execute("DELETE FROM anexos WHERE job_id NOT IN (SELECT id FROM jobs WHERE status IN (?, ?))", (PENDENTE, EXECUTANDO))
+            # Documentos guardados em memória para jobs que outro processo já pegou (ou que já terminaram).
+            ids = [job_id for job_id in list(self._documentos) if job_id not in self._em_execucao]
+            if ids:
+                pendentes = {linha['id'] for linha in conexao.execute(f"SELECT id FROM jobs WHERE status = ? AND id IN ({','.join('?' * len(ids))})", (PENDENTE, *ids))}
+                for job_id in ids:
+                    if job_id not in pendentes: self._documentos.pop(job_id, None)
+        if apagados: logging.info(f"{apagados} job(s) finalizado(s) há mais de {JOBS_RETENCAO_DIAS:g} dia(s) apagado(s).")
+
+    @staticmethod
+    def novo_id():
+        return uuid.uuid4().hex
+
+    def _inserir(self, conexao, job_id, tipo, parametros, documentos, chave=None, impressao=None):
+        # O worker deste processo usa os documentos direto da memória. A cópia em `anexos` é o preço de o job
+        # sobreviver a um reinício e poder ser executado por outro processo: é uma única escrita sequencial no WAL,
+        # no lugar do arquivo temporário gravado e relido por upload antes, e é apagada quando o job termina.
+        agora = _agora()
+        self._documentos[job_id] = documentos
+        conexao.executemany("INSERT INTO anexos (job_id, ordem, nome, sha256, conteudo, caminho) VALUES (?, ?, ?, ?, ?, ?)",
+                            [(job_id, ordem, doc.nome, doc.sha256, doc.conteudo, doc.caminho) for ordem, doc in enumerate(documentos)])
+        conexao.execute("INSERT INTO jobs (id, tipo, status, parametros, criado_em, atualizado_em, chave_idempotencia, impressao) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job_id, tipo, PENDENTE, json.dumps(parametros, ensure_ascii=False), agora, agora, chave, impressao))
+
+    def _acordar_workers(self):
+        self.iniciar()
+        with self._condicao: self._condicao.notify()
+
+    def enfileirar(self, tipo, parametros, documentos=(), job_id=None):
+        if tipo not in self._handlers: raise ValueError(f"Tipo de job desconhecido: {tipo}")
+        job_id = job_id or self.novo_id()
+        with self._conectar() as conexao:
+            conexao.execute("BEGIN")
+            try:
+                self._inserir(conexao, job_id, tipo, parametros, list(documentos))
+                conexao.execute("COMMIT")
+            except Exception:
+                conexao.execute("ROLLBACK")
+                self._documentos.pop(job_id, None)
+                raise
+        self._acordar_workers()
+        return job_id
+
+    def enfileirar_idempotente(self, tipo, chave, impressao, parametros, documentos=()):
+        """
+        Enfileira o job, a menos que a chave já tenha um job pendente, em execução ou concluído. Devolve (job_id, novo).
+        A consulta da chave e a gravação do job acontecem na mesma transação (a chave é única na tabela), então duas
+        requisições iguais simultâneas nunca geram dois jobs. Só um job com ERRO libera a chave para nova tentativa.
+        `impressao` é o hash do conteúdo: a mesma chave com outro conteúdo levanta ConflitoIdempotencia.
+        """
+        if tipo not in self._handlers: raise ValueError(f"Tipo de job desconhecido: {tipo}")
+        job_id = self.novo_id()
+        with self._conectar() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                linha = conexao.execute("SELECT id, status, impressao FROM jobs WHERE chave_idempotencia = ?", (chave,)).fetchone()
+                if linha is not None and linha['impressao'] != impressao:
+                    raise ConflitoIdempotencia(f"A chave de idempotência '{chave}' já foi usada com outro conteúdo.")
+                if linha is not None and linha['status'] != ERRO:
+                    conexao.execute("COMMIT")
+                    return linha['id'], False
+                if linha is not None:
+                    conexao.execute("UPDATE jobs SET chave_idempotencia = NULL WHERE id = ?", (linha['id'],))
+                self._inserir(conexao, job_id, tipo, parametros, list(documentos), chave, impressao)
+                conexao.execute("COMMIT")
+            except Exception:
+                conexao.execute("ROLLBACK")
+                self._documentos.pop(job_id, None)
+                raise
+        self._acordar_workers()
+        return job_id, True
+
+    def obter(self, job_id):
+        with self._conectar() as conexao:
+            linha = conexao.execute("SELECT id, tipo, status, progresso, mensagem, resultado, criado_em, atualizado_em FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if linha is None: return None
+        job = dict(linha)
+        job['resultado'] = json.loads(job['resultado']) if job['resultado'] else None
+        return job
+
+    def _atualizar(self, job_id, **campos):
+        campos['atualizado_em'] = _agora()
+        if 'resultado' in campos: campos['resultado'] = json.dumps(campos['resultado'], ensure_ascii=False, default=str)
+        atribuicoes = ', '.join(f"{nome} = ?" for nome in campos)
+        with self._conectar() as conexao:
+            conexao.execute(f"UPDATE jobs SET {atribuicoes} WHERE id = ?", (*campos.values(), job_id))
+
+    def _documentos_do_job(self, job_id):
+        documentos = self._documentos.pop(job_id, None)
+        if documentos is not None: return documentos
+        # Job de uma execução anterior do processo: os documentos são lidos da tabela de anexos.
+        with self._conectar() as conexao:
+            linhas = conexao.execute("SELECT nome, sha256, conteudo, caminho FROM anexos WHERE job_id = ? ORDER BY ordem", (job_id,)).fetchall()
+        return [DocumentoEnviado(linha['nome'], conteudo=linha['conteudo'], caminho=linha['caminho'], sha256=linha['sha256'], temporario=linha['caminho'] is not None)
+                for linha in linhas]
+
+    def _descartar_documentos(self, job_id, documentos):
+        for documento in documentos: documento.descartar()
+        with self._conectar() as conexao:
+            conexao.execute("DELETE FROM anexos WHERE job_id = ?", (job_id,))
+
+    def _reservar_proximo(self):
+        # BEGIN IMMEDIATE garante que dois workers (inclusive de processos diferentes) não pegam o mesmo job.
+        with self._conectar() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                agora = time.time()
+                recuperados = conexao.execute("UPDATE jobs SET status = ?, dono = NULL, lease_ate = NULL, atualizado_em = ? WHERE status = ? AND (lease_ate IS NULL OR lease_ate < ?)",
+                                              (PENDENTE, _agora(), EXECUTANDO, agora)).rowcount
+                if recuperados: logging.info(f"{recuperados} job(s) interrompido(s) (prazo vencido) voltaram para a fila.")
+                linha = conexao.execute("SELECT id, tipo, parametros FROM jobs WHERE status = ? ORDER BY criado_em, rowid LIMIT 1", (PENDENTE,)).fetchone()
+                if linha is not None:
+                    conexao.execute("UPDATE jobs SET status = ?, dono = ?, lease_ate = ?, atualizado_em = ? WHERE id = ?",
+                                    (EXECUTANDO, _dono(), agora + JOBS_LEASE_SEGUNDOS, _agora(), linha['id']))
+                conexao.execute("COMMIT")
+            except Exception:
+                conexao.execute("ROLLBACK")
+                raise
+        if linha is not None: self._em_execucao.add(linha['id'])
+        return linha
+
+    def _executar(self):
+        while True:
+            try:
+                linha = self._reservar_proximo()
+            except Exception as e:
+                logging.error(f"Erro ao consultar a fila de jobs: {e}", exc_info=True)
+                linha = None
+            if linha is None:
+                with self._condicao: self._condicao.wait(JOBS_INTERVALO_CONSULTA)
+                continue
+            try:
+                self._processar(linha['id'], linha['tipo'], json.loads(linha['parametros']))
+            except Exception as e:
+                logging.error(f"Erro ao finalizar o job {linha['id']}: {e}", exc_info=True)
+
+    def _processar(self, job_id, tipo, parametros):
+        logging.info(f"Job {job_id} ({tipo}) iniciado.")
+
+        def progresso(percentual, mensagem=None):
+            self._atualizar(job_id, progresso=int(percentual), mensagem=mensagem)
+
+        # Quando a requisição pediu o rastro (cabeçalho de depuração), as etapas medidas no job vão junto do resultado.
+        token_rastro = metricas.iniciar_rastro() if parametros.get('rastrear') else None
+        documentos = []
+        try:
+            documentos = self._documentos_do_job(job_id)
+            with metricas.medir(f'job.{tipo}'):
+                resultado = self._handlers[tipo](parametros, documentos, progresso)
+            if token_rastro is not None:
+                resultado, token_rastro = dict(resultado, rastro=metricas.encerrar_rastro(token_rastro)), None
+            status = CONCLUIDO if resultado.get('status') == 'SUCESSO' else ERRO
+            self._atualizar(job_id, status=status, progresso=100, resultado=resultado, mensagem=resultado.get('detalhes'))
+            metricas.incrementar('jobs_total', tipo=tipo, status=status)
+            logging.info(f"Job {job_id} ({tipo}) finalizado com status {status}.")
+        except Exception as e:
+            logging.error(f"Erro ao executar o job {job_id} ({tipo}): {e}", exc_info=True)
+            self._atualizar(job_id, status=ERRO, resultado={'status': 'ERRO', 'detalhes': f'Erro interno: {e}'}, mensagem=str(e))
+            metricas.incrementar('jobs_total', tipo=tipo, status=ERRO)
+        finally:
+            if token_rastro is not None: metricas.encerrar_rastro(token_rastro)
+            self._descartar_documentos(job_id, documentos)
+            self._em_execucao.discard(job_id)
+
+
+fila_jobs = FilaJobs(JOBS_DB, JOBS_MAX_WORKERS)
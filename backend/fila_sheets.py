@@ -0,0 +1,151 @@
+# backend/fila_sheets.py
+
+import atexit
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FuturoExpirado
+
+from gspread.utils import rowcol_to_a1
+
+from limitador_google import limitador_google
+
+# --- CONFIGURAÇÃO DA FILA DE ESCRITA ---
+# A fila é descarregada quando junta este número de operações ou quando a mais antiga espera este tempo (segundos).
+FILA_SHEETS_TAMANHO_LOTE = int(os.getenv('FILA_SHEETS_TAMANHO_LOTE', '20'))
+FILA_SHEETS_INTERVALO = float(os.getenv('FILA_SHEETS_INTERVALO', '0.5'))
+# Inclui as esperas do limitador_google quando a cota do Sheets está esgotada.
+FILA_SHEETS_TIMEOUT = float(os.getenv('FILA_SHEETS_TIMEOUT', '180'))
+
+
+class _Operacao:
+    def __init__(self, tipo, dados):
+        self.tipo = tipo
+        self.dados = dados
+        self.futuro = Future()
+
+
+class FilaEscritaSheets:
+    """
+    Fila de escrita (write-behind) para as abas do Google Sheets. As atualizações de células e as novas linhas
+    pendentes de cada aba são enviadas juntas: uma chamada `batch_update` para todas as células e uma `append_rows`
+    para todas as linhas novas. Cada operação tem um Future com o resultado, para que o chamador possa esperar.
+    """
+
+    def __init__(self, tamanho_lote, intervalo):
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self._pendentes = {}   # id(indice) -> (indice, [operações])
+        self._total_pendentes = 0
+        self._mais_antiga = None
+        self._condicao = threading.Condition()
+        self._thread = None
+
+    def _enfileirar(self, indice, operacao):
+        with self._condicao:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._executar, name='fila-sheets', daemon=True)
+                self._thread.start()
+            self._pendentes.setdefault(id(indice), (indice, []))[1].append(operacao)
+            self._total_pendentes += 1
+            if self._mais_antiga is None: self._mais_antiga = time.monotonic()
+            self._condicao.notify()
+        return operacao.futuro
+
+    def enfileirar_atualizacao(self, indice, numero_linha, celulas):
+        """Agenda a escrita de `celulas` (gspread.Cell) na linha `numero_linha`. O Future resolve para True."""
+        return self._enfileirar(indice, _Operacao('atualizacao', (numero_linha, celulas)))
+
+    def enfileirar_nova_linha(self, indice, valores):
+        """Agenda a inclusão de uma linha ao fim da aba. O Future resolve para True."""
+        return self._enfileirar(indice, _Operacao('nova_linha', valores))
+
+    def aguardar(self, futuro, timeout):
+        """
+        Espera o resultado de uma operação enfileirada. Se o prazo acabar com a operação ainda na fila, ela é
+        retirada (nunca será escrita, e a requisição pode ser repetida sem duplicar) e TimeoutError é levantado.
+        Se ela já saiu num lote, o envio está em andamento: espera-se o seu resultado, que vale como o da operação.
+        """
+        try:
+            return futuro.result(timeout=timeout)
+        except FuturoExpirado:
+            with self._condicao:
+                for chave, (_, operacoes) in list(self._pendentes.items()):
+                    operacao = next((op for op in operacoes if op.futuro is futuro), None)
+                    if operacao is None: continue
+                    operacoes.remove(operacao)
+                    if not operacoes: del self._pendentes[chave]
+                    self._total_pendentes -= 1
+                    if not self._pendentes: self._mais_antiga = None
+                    futuro.cancel()
+                    raise TimeoutError(f"A escrita no Sheets não saiu da fila em {timeout:.0f}s e foi descartada.")
+        return futuro.result()
+
+    def _retirar_lote(self):
+        lote = list(self._pendentes.values())
+        self._pendentes.clear()
+        self._total_pendentes = 0
+        self._mais_antiga = None
+        return lote
+
+    def _executar(self):
+        while True:
+            with self._condicao:
+                while True:
+                    if self._total_pendentes >= self.tamanho_lote: break
+                    if self._mais_antiga is not None:
+                        restante = self.intervalo - (time.monotonic() - self._mais_antiga)
+                        if restante <= 0: break
+                        self._condicao.wait(restante)
+                    else:
+                        self._condicao.wait()
+                lote = self._retirar_lote()
+            for indice, operacoes in lote:
+                self._enviar(indice, operacoes)
+
+    def descarregar(self):
+        """Envia imediatamente tudo o que estiver pendente, na thread de quem chamou."""
+        with self._condicao:
+            lote = self._retirar_lote()
+        for indice, operacoes in lote:
+            self._enviar(indice, operacoes)
+
+    def _enviar(self, indice, operacoes):
+        worksheet = indice.worksheet
+        atualizacoes = [op for op in operacoes if op.tipo == 'atualizacao']
+        novas_linhas = [op for op in operacoes if op.tipo == 'nova_linha']
+
+        if atualizacoes:
+            try:
+                dados = [{'range': rowcol_to_a1(celula.row, celula.col), 'values': [[celula.value]]}
+                         for op in atualizacoes for celula in op.dados[1]]
+                limitador_google.executar('sheets_escrita', 'batch_update', worksheet.batch_update, dados, value_input_option='USER_ENTERED')
+                for op in atualizacoes:
+                    numero_linha, celulas = op.dados
+                    indice.registrar_atualizacao(numero_linha, {celula.col - 1: celula.value for celula in celulas})
+                    op.futuro.set_result(True)
+                logging.info(f"Sheets '{worksheet.title}': {len(dados)} célula(s) de {len(atualizacoes)} linha(s) atualizadas num único lote.")
+            except Exception as e:
+                logging.error(f"Erro ao atualizar células em lote na aba '{worksheet.title}': {e}")
+                indice.invalidar()
+                for op in atualizacoes: op.futuro.set_exception(e)
+
+        if novas_linhas:
+            try:
+                linhas = [op.dados for op in novas_linhas]
+                # Repetir uma inclusão após erro 5xx poderia duplicar as linhas: só erros de cota são repetidos.
+                resposta = limitador_google.executar('sheets_escrita', 'append_rows', worksheet.append_rows, linhas,
+                                                     value_input_option='USER_ENTERED', repetivel=False)
+                indice.registrar_novas_linhas(resposta, linhas)
+                for op in novas_linhas: op.futuro.set_result(True)
+                logging.info(f"Sheets '{worksheet.title}': {len(linhas)} linha(s) nova(s) incluídas num único lote.")
+            except Exception as e:
+                logging.error(f"Erro ao incluir linhas em lote na aba '{worksheet.title}': {e}")
+                indice.invalidar()
+                for op in novas_linhas: op.futuro.set_exception(e)
+
+
+fila_sheets = FilaEscritaSheets(FILA_SHEETS_TAMANHO_LOTE, FILA_SHEETS_INTERVALO)
+# A thread da fila é daemon: sem isto, as escritas que ainda aguardavam o lote se perderiam no encerramento.
+atexit.register(fila_sheets.descarregar)
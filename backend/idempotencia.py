@@ -0,0 +1,156 @@
+# backend/idempotencia.py
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- CONFIGURAÇÃO DA IDEMPOTÊNCIA ---
+IDEMPOTENCIA_DB = os.path.abspath(os.getenv('IDEMPOTENCIA_DB', 'idempotencia.db'))
+# Uma reserva de upload de outra requisição ainda 'enviando' depois deste tempo (segundos) é considerada abandonada.
+IDEMPOTENCIA_RESERVA_EXPIRA = float(os.getenv('IDEMPOTENCIA_RESERVA_EXPIRA', '900'))
+
+ENVIANDO, ENVIADO = 'ENVIANDO', 'ENVIADO'
+
+
+class ArquivoEmEnvio(Exception):
+    """Outra requisição está enviando o mesmo conteúdo para a mesma pasta; o job deve falhar e ser repetido depois."""
+
+
+def _agora():
+    return datetime.now().isoformat(timespec='seconds')
+
+def _normalizar_formulario(dados_formulario):
+    # Espaços, maiúsculas e campos vazios não devem gerar chaves diferentes para o mesmo lançamento.
+    return {chave: ' '.join(str(valor).split()).lower() for chave, valor in sorted(dados_formulario.items()) if str(valor).strip()}
+
+def chave_derivada(documentos, dados_formulario):
+    """
+    Hash dos conteúdos dos arquivos e do formulário normalizado: é a chave de idempotência das requisições sem o
+    cabeçalho e, nas que o têm, a impressão do conteúdo comparada com a da primeira requisição com a mesma chave.
+    """
+    conteudo = {'arquivos': sorted(documento.sha256 for documento in documentos), 'formulario': _normalizar_formulario(dados_formulario)}
+    return 'auto-' + hashlib.sha256(json.dumps(conteudo, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class RegistroIdempotencia:
+    """
+    Registro local (SQLite) do que já foi feito, para que repetições não refaçam trabalho no Google
+    (a associação chave -> job fica na própria fila de jobs, ver `FilaJobs.enfileirar_idempotente`):
+    - etapas: etapas já concluídas de uma chave (ex.: o Sheets), puladas se o job precisar rodar de novo;
+    - arquivos_drive: (pasta do fornecedor, sha256) já enviados, para o mesmo arquivo nunca subir duas vezes na mesma pasta;
+    - partes_drive: último número de parte reservado por (pasta, prefixo), compartilhado entre os processos do backend.
+    """
+
+    def __init__(self, caminho_db, reserva_expira):
+        self.caminho_db = caminho_db
+        self.reserva_expira = reserva_expira
+        self._criar_tabelas()
+
+    @contextmanager
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho_db, timeout=30, isolation_level=None)
+        conexao.row_factory = sqlite3.Row
+        try:
+            yield conexao
+        finally:
+            conexao.close()
+
+    def _criar_tabelas(self):
+        with self._conectar() as conexao:
+            conexao.execute("PRAGMA journal_mode=WAL")
+            # Numa transação só: processos que sobem juntos não tentam criar a mesma coluna duas vezes.
+            conexao.execute("BEGIN IMMEDIATE")
+            conexao.execute("CREATE TABLE IF NOT EXISTS etapas (chave TEXT NOT NULL, etapa TEXT NOT NULL, resultado TEXT, concluido_em TEXT NOT NULL, PRIMARY KEY (chave, etapa))")
+            conexao.execute("""
+                CREATE TABLE IF NOT EXISTS arquivos_drive (
+                    id_pasta TEXT NOT NULL, sha256 TEXT NOT NULL, nome TEXT NOT NULL, status TEXT NOT NULL,
+                    reservado_em REAL NOT NULL, enviado_em TEXT, PRIMARY KEY (id_pasta, sha256)
+                )""")
+            colunas = {linha['name'] for linha in conexao.execute("PRAGMA table_info(arquivos_drive)")}
+            if 'dono' not in colunas: conexao.execute("ALTER TABLE arquivos_drive ADD COLUMN dono TEXT")
+            conexao.execute("CREATE TABLE IF NOT EXISTS partes_drive (id_pasta TEXT NOT NULL, prefixo TEXT NOT NULL, ultima_parte INTEGER NOT NULL, contado_em REAL NOT NULL, PRIMARY KEY (id_pasta, prefixo))")
+            conexao.execute("COMMIT")
+
+    # --- ETAPAS ---
+    def etapa_concluida(self, chave, etapa):
+        """Devolve o resultado gravado da etapa (ou None se ela ainda não foi concluída para esta chave)."""
+        if not chave: return None
+        with self._conectar() as conexao:
+            linha = conexao.execute("SELECT resultado FROM etapas WHERE chave = ? AND etapa = ?", (chave, etapa)).fetchone()
+        return json.loads(linha['resultado']) if linha else None
+
+    def concluir_etapa(self, chave, etapa, resultado):
+        if not chave: return
+        with self._conectar() as conexao:
+            conexao.execute("INSERT OR REPLACE INTO etapas (chave, etapa, resultado, concluido_em) VALUES (?, ?, ?, ?)",
+                            (chave, etapa, json.dumps(resultado, ensure_ascii=False), _agora()))
+
+    # --- ARQUIVOS NO DRIVE ---
+    def reservar_arquivo(self, id_pasta, sha256, nome, dono=None):
+        """
+        Reserva o envio do conteúdo `sha256` para a pasta em nome de `dono` (a chave de idempotência da requisição).
+        Devolve None se a reserva foi feita (o arquivo deve ser enviado) ou o nome do arquivo já enviado à pasta.
+        Só um envio confirmado conta como arquivo existente. A reserva do mesmo dono (o job foi interrompido e
+        voltou para a fila) é retomada; a de outro dono, ainda no prazo, levanta ArquivoEmEnvio.
+        """
+        agora = time.time()
+        with self._conectar() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                linha = conexao.execute("SELECT nome, status, reservado_em, dono FROM arquivos_drive WHERE id_pasta = ? AND sha256 = ?", (id_pasta, sha256)).fetchone()
+                if linha is not None and linha['status'] == ENVIADO:
+                    conexao.execute("COMMIT")
+                    return linha['nome']
+                if linha is not None and not (dono is not None and linha['dono'] == dono) and agora - linha['reservado_em'] < self.reserva_expira:
+                    raise ArquivoEmEnvio(f"O arquivo '{nome}' já está sendo enviado para esta pasta por outra requisição.")
+                conexao.execute("INSERT OR REPLACE INTO arquivos_drive (id_pasta, sha256, nome, status, reservado_em, dono) VALUES (?, ?, ?, ?, ?, ?)",
+                                (id_pasta, sha256, nome, ENVIANDO, agora, dono))
+                conexao.execute("COMMIT")
+                return None
+            except Exception:
+                conexao.execute("ROLLBACK")
+                raise
+
+    def confirmar_arquivo(self, id_pasta, sha256, nome):
+        with self._conectar() as conexao:
+            conexao.execute("UPDATE arquivos_drive SET nome = ?, status = ?, enviado_em = ? WHERE id_pasta = ? AND sha256 = ?",
+                            (nome, ENVIADO, _agora(), id_pasta, sha256))
+
+    def liberar_arquivo(self, id_pasta, sha256):
+        # O envio falhou: a reserva é removida para que uma nova tentativa possa enviar o arquivo.
+        with self._conectar() as conexao:
+            conexao.execute("DELETE FROM arquivos_drive WHERE id_pasta = ? AND sha256 = ? AND status = ?", (id_pasta, sha256, ENVIANDO))
+
+
+    # --- PARTES NO DRIVE ---
+    def reservar_partes(self, id_pasta, prefixo, quantidade, contar_existentes, validade):
+        """
+        Reserva `quantidade` números de parte consecutivos para o prefixo na pasta e devolve o primeiro deles.
+        `contar_existentes()` conta os arquivos do prefixo no Drive; é chamada (fora da transação) na primeira reserva
+        e quando a última contagem tiver mais de `validade` segundos, para incluir arquivos enviados por fora.
+        O contador nunca volta: vale o maior entre ele e a contagem.
+        """
+        with self._conectar() as conexao:
+            linha = conexao.execute("SELECT contado_em FROM partes_drive WHERE id_pasta = ? AND prefixo = ?", (id_pasta, prefixo)).fetchone()
+            contagem = contar_existentes() if linha is None or time.time() - linha['contado_em'] > validade else None
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                linha = conexao.execute("SELECT ultima_parte, contado_em FROM partes_drive WHERE id_pasta = ? AND prefixo = ?", (id_pasta, prefixo)).fetchone()
+                ultima, contado_em = (linha['ultima_parte'], linha['contado_em']) if linha else (0, time.time())
+                if contagem is not None: ultima, contado_em = max(ultima, contagem), time.time()
+                conexao.execute("INSERT OR REPLACE INTO partes_drive (id_pasta, prefixo, ultima_parte, contado_em) VALUES (?, ?, ?, ?)",
+                                (id_pasta, prefixo, ultima + quantidade, contado_em))
+                conexao.execute("COMMIT")
+            except Exception:
+                conexao.execute("ROLLBACK")
+                raise
+        return ultima + 1
+
+
+registro_idempotencia = RegistroIdempotencia(IDEMPOTENCIA_DB, IDEMPOTENCIA_RESERVA_EXPIRA)
+logging.debug(f"Registro de idempotência em '{IDEMPOTENCIA_DB}'.")
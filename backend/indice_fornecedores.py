@@ -0,0 +1,157 @@
+# backend/indice_fornecedores.py
+
+import hashlib
+import json
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from thefuzz import fuzz
+
+# --- PARÂMETROS DE CORRESPONDÊNCIA ---
+NOTA_MINIMA_NOME = 75       # Mesmo corte usado antes com process.extractOne em _padronizar_dados
+NOTA_MINIMA_TEXTO = 85      # Mesmo corte usado antes em _analisar_texto_bruto_comprovante
+MIN_CARACTERES_FUZZY = 5    # Apelidos mais curtos (ex.: "gt", "cmd") só casam de forma exata
+SIMILARIDADE_MINIMA_TRIGRAMAS = 0.4
+# Palavras comuns em comprovantes ("Internet Banking", "Cartão", "Aluguel"...). Um apelido que é só uma delas vale
+# no formulário, mas no texto de um comprovante não identifica o fornecedor.
+PALAVRAS_GENERICAS = {
+    'internet', 'banking', 'cartao', 'credito', 'debito', 'aluguel', 'parcelamento', 'outros', 'funcionarios',
+    'pagamento', 'pgto', 'pix', 'boleto', 'banco', 'conta', 'transferencia', 'simples', 'sindicato',
+}
+
+
+def normalizar(texto):
+    sem_acentos = unicodedata.normalize('NFKD', str(texto or '')).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', sem_acentos.lower()).split())
+
+def _trigramas(texto_normalizado):
+    texto = f" {texto_normalizado} "
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+def impressao_digital(mapeamento):
+    return hashlib.sha1(json.dumps(sorted(mapeamento.items()), ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class IndiceFornecedores:
+    """
+    Índice de fornecedores montado uma única vez a partir do mapeamento apelido -> nome oficial.
+    Consulta primeiro as correspondências exatas (apelido ou nome oficial normalizados) e só depois faz a
+    comparação aproximada, restrita aos candidatos que compartilham trigramas com o texto procurado.
+    """
+
+    def __init__(self, mapeamento):
+        # Cópia rasa para detectar edições no lugar: comparar dicionários é bem mais barato que recalcular a impressão.
+        self.mapeamento = dict(mapeamento)
+        self.versao = impressao_digital(mapeamento)
+        self.nomes_oficiais = sorted(set(mapeamento.values()))
+
+        self._oficial_por_normalizado = {normalizar(nome): nome for nome in self.nomes_oficiais}
+        self._oficial_por_apelido = {normalizar(apelido): oficial for apelido, oficial in mapeamento.items()}
+        self._apelido_por_tokens = {}
+        for apelido in mapeamento:
+            tokens = tuple(normalizar(apelido).split())
+            if tokens: self._apelido_por_tokens.setdefault(tokens, apelido)
+        # O nome oficial escrito por extenso no comprovante também identifica o fornecedor (pelo primeiro apelido dele).
+        self._apelido_por_nome_oficial = {}
+        for apelido, oficial in mapeamento.items():
+            tokens = tuple(normalizar(oficial).split())
+            if tokens: self._apelido_por_nome_oficial.setdefault(tokens, apelido)
+        self._tamanhos_apelidos = sorted({len(tokens) for tokens in (*self._apelido_por_tokens, *self._apelido_por_nome_oficial)}, reverse=True)
+
+        # Índices invertidos trigrama -> candidatos, usados para podar a comparação aproximada.
+        self._trigramas_oficiais = defaultdict(set)
+        for normalizado in self._oficial_por_normalizado:
+            for trigrama in _trigramas(normalizado): self._trigramas_oficiais[trigrama].add(normalizado)
+        self._trigramas_apelidos = defaultdict(set)
+        self._apelidos_fuzzy = {}
+        for tokens, apelido in self._apelido_por_tokens.items():
+            normalizado = ' '.join(tokens)
+            if len(normalizado) < MIN_CARACTERES_FUZZY or normalizado in PALAVRAS_GENERICAS: continue
+            self._apelidos_fuzzy[normalizado] = (apelido, len(tokens), len(_trigramas(normalizado)))
+            for trigrama in _trigramas(normalizado): self._trigramas_apelidos[trigrama].add(normalizado)
+
+    @staticmethod
+    def _trigramas_em_comum(trigramas, indice):
+        contagem = defaultdict(int)
+        for trigrama in trigramas:
+            for candidato in indice.get(trigrama, ()):
+                contagem[candidato] += 1
+        return contagem
+
+    def padronizar(self, nome_bruto):
+        """Devolve o nome oficial do fornecedor digitado no formulário, ou None se não houver correspondência."""
+        nome = normalizar(nome_bruto)
+        if not nome: return None
+        if nome in self._oficial_por_normalizado: return self._oficial_por_normalizado[nome]
+        if nome in self._oficial_por_apelido: return self._oficial_por_apelido[nome]
+
+        # Poda por cobertura: o nome digitado costuma ser parte do nome oficial (ex.: "tremonti"), então mede-se
+        # quanto dos trigramas do nome aparecem no candidato. Sem candidatos, compara com todos como antes.
+        trigramas = _trigramas(nome)
+        em_comum = self._trigramas_em_comum(trigramas, self._trigramas_oficiais)
+        candidatos = [c for c, n in em_comum.items() if n / len(trigramas) >= SIMILARIDADE_MINIMA_TRIGRAMAS]
+        if not candidatos: candidatos = self._oficial_por_normalizado.keys()
+        melhor_nome, melhor_nota = None, NOTA_MINIMA_NOME
+        for candidato in candidatos:
+            nota = fuzz.WRatio(nome, candidato)
+            if nota > melhor_nota: melhor_nome, melhor_nota = candidato, nota
+        return self._oficial_por_normalizado[melhor_nome] if melhor_nome else None
+
+    def buscar_no_texto(self, texto):
+        """Procura um apelido de fornecedor no texto de um comprovante. Devolve a chave do mapeamento ou None."""
+        tokens = normalizar(texto).split()
+        if not tokens: return None
+
+        # 1) Sequências de tokens idênticas a um nome oficial ou a um apelido, ordenadas pela especificidade:
+        #    mais tokens antes de menos e, no mesmo tamanho, nome oficial antes de apelido. Palavras genéricas
+        #    sozinhas não contam, e um empate entre fornecedores diferentes no melhor nível é ambíguo (nenhum é escolhido).
+        acertos = {}
+        for tamanho in self._tamanhos_apelidos:
+            for i in range(len(tokens) - tamanho + 1):
+                sequencia = tuple(tokens[i:i + tamanho])
+                if tamanho == 1 and sequencia[0] in PALAVRAS_GENERICAS: continue
+                apelido = self._apelido_por_tokens.get(sequencia) or self._apelido_por_nome_oficial.get(sequencia)
+                if apelido is None: continue
+                nivel = (tamanho, tamanho > 1 and sequencia in self._apelido_por_nome_oficial)
+                acertos.setdefault(nivel, {}).setdefault(self._oficial_por_apelido[normalizar(apelido)], apelido)
+        if acertos:
+            melhores = acertos[max(acertos)]
+            return next(iter(melhores.values())) if len(melhores) == 1 else None
+
+        # 2) Janelas do texto com o mesmo número de tokens do apelido, pontuadas só contra os candidatos podados.
+        melhor_apelido, melhor_nota = None, NOTA_MINIMA_TEXTO - 1
+        janelas_vistas = set()
+        for tamanho in {info[1] for info in self._apelidos_fuzzy.values()}:
+            for i in range(len(tokens) - tamanho + 1):
+                janela = ' '.join(tokens[i:i + tamanho])
+                if janela in janelas_vistas: continue
+                janelas_vistas.add(janela)
+                trigramas = _trigramas(janela)
+                for candidato, em_comum in self._trigramas_em_comum(trigramas, self._trigramas_apelidos).items():
+                    apelido, tamanho_apelido, total_trigramas = self._apelidos_fuzzy[candidato]
+                    if tamanho_apelido != tamanho: continue
+                    if 2 * em_comum / (len(trigramas) + total_trigramas) < SIMILARIDADE_MINIMA_TRIGRAMAS: continue
+                    nota = fuzz.ratio(janela, candidato)
+                    if nota > melhor_nota or (nota == melhor_nota and melhor_apelido and len(apelido) > len(melhor_apelido)):
+                        melhor_apelido, melhor_nota = apelido, nota
+        return melhor_apelido
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def obter_indice(mapeamento):
+    """
+    Devolve o índice do mapeamento atual, reconstruindo-o (e trocando a `versao`) só quando o conteúdo muda,
+    inclusive por edições no próprio dicionário. A verificação é uma comparação de dicionários, sem hash.
+    """
+    global _indice
+    indice = _indice
+    if indice is not None and indice.mapeamento == mapeamento: return indice
+    with _indice_lock:
+        if _indice is None or _indice.mapeamento != mapeamento:
+            _indice = IndiceFornecedores(mapeamento)
+        return _indice
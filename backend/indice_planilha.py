@@ -0,0 +1,144 @@
+# backend/indice_planilha.py
+
+import logging
+import os
+import re
+import threading
+import time
+
+from limitador_google import limitador_google
+
+# --- CONFIGURAÇÃO DO ÍNDICE DAS PLANILHAS ---
+# Depois deste tempo (em segundos) a aba é baixada de novo, para refletir edições feitas diretamente no Sheets.
+SHEETS_INDICE_TTL = float(os.getenv('SHEETS_INDICE_TTL', '60'))
+
+COLUNAS_CHAVE = ('Conta', 'Valor', 'Data de vencimento')
+
+
+class IndicePlanilha:
+    """
+    Cópia em memória de uma aba mensal: cabeçalho, linhas e um índice (Conta, Valor, Data de vencimento) -> linhas.
+    É atualizada no lugar quando as nossas escritas dão certo e recarregada por completo quando o TTL expira.
+    """
+
+    def __init__(self, worksheet, normalizar_valor):
+        self.worksheet = worksheet
+        self.lock = threading.RLock()
+        self._normalizar_valor = normalizar_valor
+        self._carregado_em = None
+        self.cabecalho, self.posicoes = [], {}
+        self._linhas, self._indice = {}, {}
+
+    def _chave(self, conta, valor, vencimento):
+        return (conta, self._normalizar_valor(valor), vencimento)
+
+    def _chave_da_linha(self, dados_linha):
+        if not self.colunas_chave_presentes(): return None
+        conta_idx, valor_idx, vencimento_idx = (self.posicoes[coluna] for coluna in COLUNAS_CHAVE)
+        if len(dados_linha) <= max(conta_idx, valor_idx, vencimento_idx): return None
+        return self._chave(dados_linha[conta_idx], dados_linha[valor_idx], dados_linha[vencimento_idx])
+
+    def _indexar(self, numero_linha, dados_linha):
+        chave = self._chave_da_linha(dados_linha)
+        if chave is None: return
+        linhas = self._indice.setdefault(chave, [])
+        if numero_linha not in linhas:
+            linhas.append(numero_linha)
+            linhas.sort()
+
+    def _desindexar(self, numero_linha, dados_linha):
+        chave = self._chave_da_linha(dados_linha)
+        if chave is not None and numero_linha in self._indice.get(chave, []):
+            self._indice[chave].remove(numero_linha)
+
+    def recarregar(self):
+        with self.lock:
+            todas_linhas = limitador_google.executar('sheets_leitura', 'get_all_values', self.worksheet.get_all_values)
+            self.cabecalho = todas_linhas[0] if todas_linhas else []
+            self.posicoes = {nome: i for i, nome in reversed(list(enumerate(self.cabecalho)))}
+            self._linhas, self._indice = {}, {}
+            if all(coluna in self.posicoes for coluna in COLUNAS_CHAVE):
+                for numero_linha, dados_linha in enumerate(todas_linhas[1:], start=2):
+                    self._linhas[numero_linha] = dados_linha
+                    self._indexar(numero_linha, dados_linha)
+            self._carregado_em = time.monotonic()
+            logging.info(f"Índice da aba '{self.worksheet.title}' recarregado: {max(0, len(todas_linhas) - 1)} linha(s).")
+
+    def revalidar(self):
+        with self.lock:
+            if self._carregado_em is None or time.monotonic() - self._carregado_em > SHEETS_INDICE_TTL:
+                self.recarregar()
+
+    def invalidar(self):
+        with self.lock:
+            self._carregado_em = None
+
+    def colunas_chave_presentes(self):
+        return all(coluna in self.posicoes for coluna in COLUNAS_CHAVE)
+
+    def buscar(self, conta, valor, vencimento):
+        """Devolve (numero_linha, dados_linha) da primeira linha com a chave informada, ou None."""
+        with self.lock:
+            linhas = self._indice.get(self._chave(conta, valor, vencimento))
+            if not linhas: return None
+            return linhas[0], list(self._linhas[linhas[0]])
+
+    def buscar_confirmado(self, conta, valor, vencimento):
+        # Confere só a linha encontrada antes de escrevermos nela: se alguém inseriu ou removeu linhas direto
+        # no Sheets dentro do TTL, a aba é recarregada e a busca refeita.
+        with self.lock:
+            encontrado = self.buscar(conta, valor, vencimento)
+            if not encontrado: return None
+            numero_linha, dados_linha = encontrado
+            dados_atuais = limitador_google.executar('sheets_leitura', 'row_values', self.worksheet.row_values, numero_linha)
+            if self._chave_da_linha(dados_atuais) == self._chave(conta, valor, vencimento):
+                self._desindexar(numero_linha, dados_linha)
+                self._linhas[numero_linha] = dados_atuais
+                self._indexar(numero_linha, dados_atuais)
+                return numero_linha, list(dados_atuais)
+            self.recarregar()
+            return self.buscar(conta, valor, vencimento)
+
+    def registrar_atualizacao(self, numero_linha, valores_por_coluna):
+        # valores_por_coluna: {índice da coluna (base 0): valor escrito}
+        with self.lock:
+            dados_linha = list(self._linhas.get(numero_linha, []))
+            self._desindexar(numero_linha, dados_linha)
+            for col_idx, valor in valores_por_coluna.items():
+                if len(dados_linha) <= col_idx: dados_linha.extend([''] * (col_idx + 1 - len(dados_linha)))
+                dados_linha[col_idx] = str(valor)
+            self._linhas[numero_linha] = dados_linha
+            self._indexar(numero_linha, dados_linha)
+
+    def registrar_novas_linhas(self, resposta_append, linhas):
+        # A API devolve o intervalo escrito (ex.: "'Março'!A15:G17"); sem ele não sabemos as linhas e o índice é recarregado.
+        intervalo = (resposta_append or {}).get('updates', {}).get('updatedRange', '')
+        encontrado = re.search(r'![A-Z]+(\d+)', intervalo)
+        with self.lock:
+            if not encontrado:
+                self.invalidar()
+                return
+            primeira_linha = int(encontrado.group(1))
+            for numero_linha, dados_linha in enumerate(linhas, start=primeira_linha):
+                self._linhas[numero_linha] = list(dados_linha)
+                self._indexar(numero_linha, dados_linha)
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+
+def obter_indice_planilha(gspread_client, spreadsheet_id, gid, normalizar_valor):
+    """Devolve o índice da aba `gid`, abrindo a planilha só na primeira vez e recarregando quando o TTL expira."""
+    chave = (spreadsheet_id, int(gid))
+    with _indices_lock:
+        indice = _indices.get(chave)
+        if indice is None:
+            # open_by_key e get_worksheet_by_id leem os metadados da planilha: duas leituras da cota.
+            worksheet = limitador_google.executar('sheets_leitura', 'abrir_aba', lambda: gspread_client.open_by_key(spreadsheet_id).get_worksheet_by_id(int(gid)), custo=2)
+            indice = _indices[chave] = IndicePlanilha(worksheet, normalizar_valor)
+    indice.revalidar()
+    return indice
+
+def descartar_indices():
+    with _indices_lock:
+        _indices.clear()
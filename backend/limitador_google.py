@@ -0,0 +1,192 @@
+# backend/limitador_google.py
+
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from metricas import metricas
+
+# --- CONFIGURAÇÃO DAS COTAS DO GOOGLE ---
+# Requisições por minuto de cada cota (por usuário). O Sheets conta leituras e escritas separadamente.
+GOOGLE_COTA_SHEETS_LEITURA_POR_MINUTO = float(os.getenv('GOOGLE_COTA_SHEETS_LEITURA_POR_MINUTO', '60'))
+GOOGLE_COTA_SHEETS_ESCRITA_POR_MINUTO = float(os.getenv('GOOGLE_COTA_SHEETS_ESCRITA_POR_MINUTO', '60'))
+GOOGLE_COTA_DRIVE_POR_MINUTO = float(os.getenv('GOOGLE_COTA_DRIVE_POR_MINUTO', '12000'))
+# Quantos segundos de cota podem ser gastos de uma vez (tamanho do balde).
+GOOGLE_RAJADA_SEGUNDOS = float(os.getenv('GOOGLE_RAJADA_SEGUNDOS', '10'))
+GOOGLE_TENTATIVAS = int(os.getenv('GOOGLE_TENTATIVAS', '6'))
+GOOGLE_BACKOFF_BASE = float(os.getenv('GOOGLE_BACKOFF_BASE', '1'))
+GOOGLE_BACKOFF_MAXIMO = float(os.getenv('GOOGLE_BACKOFF_MAXIMO', '64'))
+# Estado dos baldes, compartilhado pelos processos da mesma máquina (protegido por uma trava de arquivo).
+GOOGLE_COTA_ESTADO = os.path.abspath(os.getenv('GOOGLE_COTA_ESTADO', 'google_cota.json'))
+
+# cota -> (api, requisições por minuto)
+COTAS = {
+    'sheets_leitura': ('sheets', GOOGLE_COTA_SHEETS_LEITURA_POR_MINUTO),
+    'sheets_escrita': ('sheets', GOOGLE_COTA_SHEETS_ESCRITA_POR_MINUTO),
+    'drive': ('drive', GOOGLE_COTA_DRIVE_POR_MINUTO),
+}
+
+_STATUS_REPETIVEIS = {429, 500, 502, 503, 504}
+_MOTIVOS_COTA = ('ratelimitexceeded', 'userratelimitexceeded', 'quota')
+
+
+@contextmanager
+def _trava_arquivo(caminho):
+    # Trava exclusiva entre processos: flock no Linux/macOS, msvcrt.locking no Windows.
+    with open(caminho, 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def _status_http(erro):
+    """Status HTTP de um erro do gspread (APIError), do googleapiclient (HttpError) ou do requests; 0 para falha de rede."""
+    resposta = getattr(erro, 'response', None)
+    if getattr(resposta, 'status_code', None): return resposta.status_code
+    resp = getattr(erro, 'resp', None)
+    if resp is not None and getattr(resp, 'status', None): return int(resp.status)
+    if isinstance(erro, (ConnectionError, TimeoutError, requests.exceptions.ConnectionError, requests.exceptions.Timeout)): return 0
+    return None
+
+def _limite_de_cota(status, erro):
+    # O Drive responde 403 (rateLimitExceeded/userRateLimitExceeded) quando a cota acaba; o Sheets responde 429.
+    return status == 429 or (status == 403 and any(motivo in str(erro).lower() for motivo in _MOTIVOS_COTA))
+
+def _retry_after(erro):
+    resposta = getattr(erro, 'response', None)
+    valor = getattr(resposta, 'headers', {}).get('Retry-After') if resposta is not None else None
+    if valor is None and getattr(erro, 'resp', None) is not None: valor = erro.resp.get('retry-after')
+    try:
+        return float(valor) if valor is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class LimitadorGoogle:
+    """
+    Limita e repete as chamadas às APIs do Google. Cada cota é um balde de fichas (token bucket) reabastecido
+    na taxa da cota; o estado fica num arquivo JSON travado, então threads e processos de trabalho dividem a mesma cota.
+    Um 429 (ou 403 de cota do Drive) pausa a cota para todos por um tempo que dobra a cada erro seguido, com jitter;
+    erros 5xx e de rede são repetidos só por quem os recebeu. Chamadas que não podem ser repetidas com segurança
+    (criar arquivos, incluir linhas) só são repetidas em erros de cota, em que o Google não executou o pedido.
+    """
+
+    def __init__(self, caminho_estado, cotas, rajada_segundos, tentativas, backoff_base, backoff_maximo):
+        self.caminho_estado = caminho_estado
+        self.cotas = cotas
+        self.rajada_segundos = rajada_segundos
+        self.tentativas = tentativas
+        self.backoff_base = backoff_base
+        self.backoff_maximo = backoff_maximo
+        self._lock = threading.Lock()
+        self._cotas_com_falha = set()
+
+    @contextmanager
+    def _estado(self):
+        # Lê, entrega para alteração e grava o estado, tudo sob a trava (de threads e de processos).
+        with self._lock, _trava_arquivo(f"{self.caminho_estado}.lock"):
+            try:
+                with open(self.caminho_estado, 'r', encoding='utf-8') as f:
+                    estado = json.load(f)
+            except (OSError, ValueError):
+                estado = {}
+            yield estado
+            temporario = f"{self.caminho_estado}.{os.getpid()}.tmp"
+            with open(temporario, 'w', encoding='utf-8') as f:
+                json.dump(estado, f)
+            os.replace(temporario, self.caminho_estado)
+
+    def _capacidade(self, cota):
+        return max(1.0, self.cotas[cota][1] / 60 * self.rajada_segundos)
+
+    def adquirir(self, cota, custo=1):
+        """Bloqueia até haver `custo` fichas na cota (e ela não estar pausada) e as consome."""
+        taxa = self.cotas[cota][1] / 60
+        custo = min(custo, self._capacidade(cota))
+        while True:
+            with self._estado() as estado:
+                agora = time.time()
+                balde = estado.setdefault(cota, {'fichas': self._capacidade(cota), 'atualizado_em': agora, 'pausado_ate': 0, 'falhas': 0})
+                balde['fichas'] = min(self._capacidade(cota), balde['fichas'] + max(0.0, agora - balde['atualizado_em']) * taxa)
+                balde['atualizado_em'] = agora
+                if balde['pausado_ate'] > agora:
+                    espera = balde['pausado_ate'] - agora
+                elif balde['fichas'] >= custo:
+                    balde['fichas'] -= custo
+                    return
+                else:
+                    espera = (custo - balde['fichas']) / taxa
+            metricas.observar(f'limitador.espera_{cota}', espera)
+            time.sleep(espera)
+
+    def _pausar(self, cota, retry_after):
+        # Backoff exponencial compartilhado: cada 429 seguido dobra a pausa da cota para todos os processos.
+        with self._estado() as estado:
+            agora = time.time()
+            balde = estado.setdefault(cota, {'fichas': 0.0, 'atualizado_em': agora, 'pausado_ate': 0, 'falhas': 0})
+            balde['falhas'] += 1
+            pausa = retry_after or random.uniform(0.5, 1.0) * min(self.backoff_maximo, self.backoff_base * 2 ** (balde['falhas'] - 1))
+            balde['pausado_ate'] = max(balde['pausado_ate'], agora + pausa)
+            balde['fichas'] = 0.0
+        self._cotas_com_falha.add(cota)
+        return pausa
+
+    def _registrar_sucesso(self, cota):
+        if cota not in self._cotas_com_falha: return
+        self._cotas_com_falha.discard(cota)
+        with self._estado() as estado:
+            if cota in estado: estado[cota]['falhas'] = 0
+
+    def executar(self, cota, operacao, funcao, *args, repetivel=True, custo=1, **kwargs):
+        """
+        Chama funcao(*args, **kwargs) respeitando a cota e repetindo em erros transitórios.
+        `repetivel=False` para operações que não são idempotentes: só são repetidas em erro de cota.
+        """
+        api = self.cotas[cota][0]
+        for tentativa in range(1, self.tentativas + 1):
+            self.adquirir(cota, custo)
+            try:
+                with metricas.chamada_google(api, operacao):
+                    resultado = funcao(*args, **kwargs)
+                self._registrar_sucesso(cota)
+                return resultado
+            except Exception as e:
+                status = _status_http(e)
+                cota_esgotada = _limite_de_cota(status, e)
+                if tentativa == self.tentativas or not (cota_esgotada or (repetivel and status in _STATUS_REPETIVEIS | {0})):
+                    raise
+                metricas.incrementar('google_novas_tentativas_total', api=api, operacao=operacao, status=status)
+                if cota_esgotada:
+                    pausa = self._pausar(cota, _retry_after(e))
+                    logging.warning(f"Cota '{cota}' do Google esgotada em {operacao}; pausando por {pausa:.1f}s (tentativa {tentativa}).")
+                else:
+                    espera = _retry_after(e) or random.uniform(0, min(self.backoff_maximo, self.backoff_base * 2 ** (tentativa - 1)))
+                    logging.warning(f"Erro {status} em {api}.{operacao}; nova tentativa em {espera:.1f}s (tentativa {tentativa}).")
+                    time.sleep(espera)
+
+
+limitador_google = LimitadorGoogle(GOOGLE_COTA_ESTADO, COTAS, GOOGLE_RAJADA_SEGUNDOS, GOOGLE_TENTATIVAS,
+                                   GOOGLE_BACKOFF_BASE, GOOGLE_BACKOFF_MAXIMO)
@@ -0,0 +1,131 @@
+# backend/metricas.py
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- CONFIGURAÇÃO DAS MÉTRICAS ---
+METRICAS_PREFIXO = os.getenv('METRICAS_PREFIXO', 'doppio')
+# Limites (em segundos) dos baldes dos histogramas de duração.
+METRICAS_LIMITES = tuple(float(limite) for limite in os.getenv('METRICAS_LIMITES', '0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30').split(','))
+
+# Rastro da requisição (ou do job) atual: lista de etapas, ou None quando o rastreamento não foi pedido.
+_rastro_atual = contextvars.ContextVar('rastro_atual', default=None)
+
+
+def _escapar_rotulo(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _rotulos(pares):
+    return '{' + ','.join(f'{nome}="{_escapar_rotulo(valor)}"' for nome, valor in pares) + '}' if pares else ''
+
+
+class RegistroMetricas:
+    """
+    Histogramas de duração por etapa e contadores (ex.: chamadas e erros das APIs do Google), mantidos em memória
+    e exportados no formato de texto do Prometheus. Cada etapa medida também entra no rastro da requisição atual,
+    quando ele foi pedido (ver `iniciar_rastro`).
+    """
+
+    def __init__(self, prefixo, limites):
+        self.prefixo = prefixo
+        self.limites = tuple(sorted(limites))
+        self._lock = threading.Lock()
+        self._histogramas = {}  # etapa -> [contagem por balde, soma, total]
+        self._contadores = {}   # (nome, ((rótulo, valor), ...)) -> valor
+
+    def observar(self, etapa, segundos, erro=False):
+        """Registra uma duração já medida (ex.: a que veio de um processo de OCR)."""
+        with self._lock:
+            histograma = self._histogramas.setdefault(etapa, [[0] * len(self.limites), 0.0, 0])
+            for i, limite in enumerate(self.limites):
+                if segundos <= limite: histograma[0][i] += 1
+            histograma[1] += segundos
+            histograma[2] += 1
+        rastro = _rastro_atual.get()
+        if rastro is not None:
+            rastro.append({'etapa': etapa, 'duracao_ms': round(segundos * 1000, 2), **({'erro': True} if erro else {})})
+
+    @contextmanager
+    def medir(self, etapa):
+        inicio = time.perf_counter()
+        erro = False
+        try:
+            yield
+        except BaseException:
+            erro = True
+            raise
+        finally:
+            self.observar(etapa, time.perf_counter() - inicio, erro)
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    @contextmanager
+    def chamada_google(self, api, operacao):
+        """Mede uma chamada a uma API do Google e conta as chamadas e os erros por API e operação."""
+        self.incrementar('google_chamadas_total', api=api, operacao=operacao)
+        try:
+            with self.medir(f'{api}.{operacao}'):
+                yield
+        except Exception:
+            self.incrementar('google_erros_total', api=api, operacao=operacao)
+            raise
+
+    # --- RASTRO POR REQUISIÇÃO ---
+    def iniciar_rastro(self):
+        """Passa a guardar as etapas medidas neste contexto; devolve o token para `encerrar_rastro`."""
+        return _rastro_atual.set([])
+
+    def encerrar_rastro(self, token):
+        rastro = _rastro_atual.get()
+        _rastro_atual.reset(token)
+        return list(rastro or [])
+
+    @staticmethod
+    def propagar(funcao):
+        # Para tarefas enviadas a pools de threads: a etapa medida lá entra no rastro de quem a enviou.
+        contexto = contextvars.copy_context()
+        return lambda *args, **kwargs: contexto.run(funcao, *args, **kwargs)
+
+    # --- EXPORTAÇÃO ---
+    def texto_prometheus(self, medidores=None, contadores_externos=None):
+        """
+        Todas as métricas no formato de exposição do Prometheus. `medidores` são valores instantâneos (gauges) e
+        `contadores_externos`, totais que só crescem mantidos por outros módulos (ex.: acertos do cache de OCR).
+        """
+        with self._lock:
+            histogramas = {etapa: (list(baldes), soma, total) for etapa, (baldes, soma, total) in self._histogramas.items()}
+            contadores = dict(self._contadores)
+
+        linhas = []
+        nome = f'{self.prefixo}_etapa_duracao_segundos'
+        linhas += [f'# HELP {nome} Duração de cada etapa do processamento.', f'# TYPE {nome} histogram']
+        for etapa, (baldes, soma, total) in sorted(histogramas.items()):
+            for limite, contagem in zip(self.limites, baldes):
+                linhas.append(f'{nome}_bucket{_rotulos([("etapa", etapa), ("le", repr(limite))])} {contagem}')
+            linhas.append(f'{nome}_bucket{_rotulos([("etapa", etapa), ("le", "+Inf")])} {total}')
+            linhas.append(f'{nome}_sum{_rotulos([("etapa", etapa)])} {soma}')
+            linhas.append(f'{nome}_count{_rotulos([("etapa", etapa)])} {total}')
+
+        for nome_contador in sorted({nome for nome, _ in contadores}):
+            nome = f'{self.prefixo}_{nome_contador}'
+            linhas.append(f'# TYPE {nome} counter')
+            for (chave, rotulos), valor in sorted(contadores.items()):
+                if chave == nome_contador: linhas.append(f'{nome}{_rotulos(rotulos)} {valor}')
+
+        for nome_contador, valor in sorted((contadores_externos or {}).items()):
+            nome = f'{self.prefixo}_{nome_contador}'
+            linhas += [f'# TYPE {nome} counter', f'{nome} {valor}']
+
+        for nome_medidor, valor in sorted((medidores or {}).items()):
+            nome = f'{self.prefixo}_{nome_medidor}'
+            linhas += [f'# TYPE {nome} gauge', f'{nome} {valor}']
+        return '\n'.join(linhas) + '\n'
+
+
+metricas = RegistroMetricas(METRICAS_PREFIXO, METRICAS_LIMITES)
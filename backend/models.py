@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
-from .database import Base
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Index, UniqueConstraint
+from database import Base
 
 class Venda(Base):
     __tablename__ = "vendas"
@@ -11,4 +11,24 @@ class Venda(Base):
     valor_unitario = Column(Float)
     valor_total = Column(Float)
     data_venda = Column(DateTime)
-    origem = Column(String) # Para saber se veio do Conta Azul ou TOTVS
\ No newline at end of file
+    origem = Column(String) # Para saber se veio do Conta Azul ou TOTVS
+
+    __table_args__ = (
+        Index('ix_vendas_data_venda_produto', 'data_venda', 'produto'), # Consultas por período (e produto) e recálculo dos resumos
+    )
+
+class VendaDiaria(Base):
+    # Resumo pré-agregado das vendas por dia, produto e origem, mantido por `carga_vendas.atualizar_resumos_diarios`
+    __tablename__ = "vendas_diarias"
+
+    id = Column(Integer, primary_key=True, index=True)
+    data = Column(Date, nullable=False)
+    produto = Column(String)
+    origem = Column(String)
+    valor_total = Column(Float) # Soma de valor_total das vendas do dia
+    quantidade_vendas = Column(Integer) # Número de vendas (linhas) do dia
+    preco_medio = Column(Float) # Média de valor_unitario
+
+    __table_args__ = (
+        UniqueConstraint('data', 'produto', 'origem', name='uq_vendas_diarias_data_produto_origem'),
+    )
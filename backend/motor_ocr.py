@@ -0,0 +1,167 @@
+# backend/motor_ocr.py
+
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytesseract
+from pdf2image import convert_from_path, pdfinfo_from_path
+from pypdf import PdfReader
+
+from metricas import metricas
+
+# --- CONFIGURAÇÃO DO MOTOR DE OCR ---
+# O número de processos limita quantas páginas ficam renderizadas em memória ao mesmo tempo.
+OCR_MAX_WORKERS = int(os.getenv('OCR_MAX_WORKERS', os.cpu_count() or 1))
+OCR_DPI = int(os.getenv('OCR_DPI', '200'))
+OCR_IDIOMA = os.getenv('OCR_IDIOMA', 'por')
+# Páginas cuja camada de texto nativa tenha menos caracteres úteis que isto são enviadas ao Tesseract.
+OCR_MIN_CARACTERES_TEXTO = int(os.getenv('OCR_MIN_CARACTERES_TEXTO', '20'))
+
+# Os processos do OCR não podem nascer de um fork do servidor: ele já tem threads (workers da fila, Sheets, Drive)
+# e um fork copiaria locks presos por elas. O forkserver (ou o spawn, onde não existe) parte de um processo limpo.
+_CONTEXTO_OCR = multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=OCR_MAX_WORKERS, mp_context=_CONTEXTO_OCR)
+            logging.info(f"Pool de OCR iniciado com {OCR_MAX_WORKERS} processo(s).")
+        return _pool
+
+def _descartar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def _ocr_pagina(caminho, numero_pagina, dpi, idioma):
+    # Executa no processo filho: renderiza apenas uma página e libera a imagem logo após o OCR.
+    # Devolve (texto, segundos na renderização, segundos no Tesseract); as métricas são registradas no processo principal.
+    inicio = time.perf_counter()
+    imagens = convert_from_path(caminho, dpi=dpi, first_page=numero_pagina, last_page=numero_pagina)
+    meio = time.perf_counter()
+    try:
+        texto = "".join(pytesseract.image_to_string(img, lang=idioma) + "\n" for img in imagens)
+        return texto, meio - inicio, time.perf_counter() - meio
+    finally:
+        for img in imagens: img.close()
+
+@contextmanager
+def _arquivo_para_ocr(documento):
+    # Os processos filhos recebem só o caminho do PDF. Um documento em memória é gravado uma única vez num arquivo
+    # temporário, em vez de ter o conteúdo inteiro enviado (e regravado pelo pdf2image) a cada página.
+    if documento.caminho is not None:
+        yield documento.caminho
+        return
+    arquivo = tempfile.NamedTemporaryFile(delete=False, prefix='ocr-', suffix='.pdf')
+    try:
+        with arquivo: arquivo.write(documento.conteudo)
+        yield arquivo.name
+    finally:
+        try: os.remove(arquivo.name)
+        except OSError as e: logging.error(f"Erro ao remover o arquivo temporário de OCR de '{documento.nome}': {e}")
+
+def _ler_camada_texto(documento):
+    # Lê o texto embutido de cada página (PDFs gerados pelo banco). Devolve None se o PDF não puder ser lido.
+    try:
+        with documento.abrir() as f:
+            return [pagina.extract_text() or "" for pagina in PdfReader(f).pages]
+    except Exception as e:
+        logging.warning(f"Não foi possível ler a camada de texto de '{documento.nome}': {e}")
+        return None
+
+def _texto_utilizavel(texto):
+    return texto is not None and sum(1 for c in texto if not c.isspace()) >= OCR_MIN_CARACTERES_TEXTO
+
+def _extrair_texto_arquivo(documento, criterio_parada):
+    with ExitStack() as pilha:
+        caminho = None
+        def caminho_para_ocr():
+            # O arquivo só é criado se alguma página precisar do Tesseract (ou o PDF não tiver camada de texto legível).
+            nonlocal caminho
+            if caminho is None: caminho = pilha.enter_context(_arquivo_para_ocr(documento))
+            return caminho
+        return _extrair_paginas(documento, criterio_parada, caminho_para_ocr)
+
+def _extrair_paginas(documento, criterio_parada, caminho_para_ocr):
+    with metricas.medir('ocr.camada_texto'):
+        camada_texto = _ler_camada_texto(documento)
+    total_paginas = len(camada_texto) if camada_texto is not None else int(pdfinfo_from_path(caminho_para_ocr()).get('Pages', 0))
+    if camada_texto is None: camada_texto = [None] * total_paginas
+
+    pool = _obter_pool()
+    partes, pendentes = [], deque()
+    proxima_pagina = paginas_ocr = 0
+    em_execucao = 0
+    try:
+        while proxima_pagina < total_paginas or pendentes:
+            # Mantém no máximo OCR_MAX_WORKERS páginas deste arquivo no pool; as páginas com texto nativo não ocupam vaga.
+            while proxima_pagina < total_paginas and em_execucao < OCR_MAX_WORKERS:
+                texto_nativo = camada_texto[proxima_pagina]
+                if _texto_utilizavel(texto_nativo):
+                    pendentes.append(texto_nativo + "\n")
+                else:
+                    pendentes.append(pool.submit(_ocr_pagina, caminho_para_ocr(), proxima_pagina + 1, OCR_DPI, OCR_IDIOMA))
+                    em_execucao += 1
+                    paginas_ocr += 1
+                proxima_pagina += 1
+
+            item = pendentes.popleft()
+            if isinstance(item, Future):
+                em_execucao -= 1
+                item, segundos_renderizacao, segundos_tesseract = item.result()
+                metricas.observar('ocr.renderizacao', segundos_renderizacao)
+                metricas.observar('ocr.tesseract', segundos_tesseract)
+            partes.append(item)
+
+            # Saída antecipada: se o texto já lido basta para a análise, as páginas restantes são ignoradas.
+            if criterio_parada and criterio_parada("".join(partes)):
+                break
+    finally:
+        for item in pendentes:
+            if isinstance(item, Future): item.cancel()
+
+    logging.info(f"'{documento.nome}': {len(partes)}/{total_paginas} página(s) lidas, {paginas_ocr} via OCR.")
+    return "".join(partes)
+
+def extrair_textos(documentos, criterio_parada=None):
+    """
+    Extrai o texto de vários PDFs (DocumentoEnviado). Usa primeiro a camada de texto nativa de cada página e recorre ao Tesseract
+    (no pool de processos) só para as páginas sem texto utilizável. Se `criterio_parada(texto)` devolver True,
+    as páginas restantes daquele arquivo não são processadas.
+    Devolve uma lista de textos na mesma ordem dos documentos ("" para arquivos que falharam).
+    """
+    if not documentos: return []
+    with ThreadPoolExecutor(max_workers=min(len(documentos), OCR_MAX_WORKERS)) as executor:
+        futuros = [executor.submit(metricas.propagar(_extrair_texto_arquivo), documento, criterio_parada) for documento in documentos]
+
+    textos = []
+    for documento, futuro in zip(documentos, futuros):
+        try:
+            textos.append(futuro.result())
+        except BrokenProcessPool:
+            logging.error("O pool de OCR foi interrompido. Será recriado na próxima requisição.")
+            _descartar_pool()
+            textos.append("")
+        except Exception as e:
+            logging.error(f"Erro ao extrair texto de '{documento.nome}': {e}")
+            textos.append("")
+    return textos
+
+def configuracao_ocr():
+    # Parâmetros que alteram o texto extraído; usados na chave do cache de OCR.
+    return {'dpi': OCR_DPI, 'idioma': OCR_IDIOMA, 'min_caracteres_texto': OCR_MIN_CARACTERES_TEXTO}
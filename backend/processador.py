@@ -7,41 +7,22 @@ from datetime import datetime
 from pathlib import Path
 from decimal import Decimal, InvalidOperation
 
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
 import gspread
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload
-from thefuzz import process
-import pytesseract
-from pdf2image import convert_from_path
 import re
+from motor_ocr import extrair_textos, configuracao_ocr
+from cache_ocr import cache_ocr
+from indice_fornecedores import obter_indice
+from indice_planilha import obter_indice_planilha
+from fila_sheets import fila_sheets, FILA_SHEETS_TIMEOUT
+from uploader_drive import uploader_drive
+from clientes_google import clientes_google, COMANDO_AUTORIZACAO
+from metricas import metricas
+from idempotencia import registro_idempotencia
 
-# --- CONFIGURAÇÃO (sem alterações) ---
+# --- CONFIGURAÇÃO ---
+# As credenciais e os clientes do Google são criados sob demanda pelo clientes_google, na primeira operação.
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
-CLIENT_SECRET_FILE = 'client_secret.json'
-TOKEN_FILE = 'token.json'
 GOOGLE_SHEET_ID = os.getenv('GOOGLE_SHEET_ID')
-creds = None
-if os.path.exists(TOKEN_FILE):
-    creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-if not creds or not creds.valid:
-    if creds and creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-    else:
-        flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRET_FILE, SCOPES)
-        creds = flow.run_local_server(port=8080)
-    with open(TOKEN_FILE, 'w') as token:
-        token.write(creds.to_json())
-try:
-    gspread_client = gspread.authorize(creds)
-    drive_service = build('drive', 'v3', credentials=creds)
-    logging.info("Credenciais do Google (OAuth 2.0) carregadas com sucesso.")
-except Exception as e:
-    logging.error(f"ERRO CRÍTICO ao carregar credenciais do Google: {e}", exc_info=True)
-    creds = gspread_client = drive_service = None
 
 # --- MAPEAMENTO DE FORNECEDORES (sem alterações) ---
 mapeamento_fornecedores = {
@@ -83,10 +64,8 @@ def _padronizar_dados(dados_do_formulario):
                 # Se falhar, assume que já está em DD/MM/AAAA e não faz nada
                 pass
     
-    nome_padronizado = "NÃO SEI"
-    nomes_oficiais = list(set(mapeamento_fornecedores.values()))
-    melhor_match = process.extractOne(nome_bruto, nomes_oficiais)
-    if melhor_match and melhor_match[1] > 75: nome_padronizado = melhor_match[0]
+    with metricas.medir('fornecedores.padronizar'):
+        nome_padronizado = obter_indice(mapeamento_fornecedores).padronizar(nome_bruto) or "NÃO SEI"
     
     id_drive, id_sheets = None, None
     data_vencimento_final = dados_do_formulario.get('vencimento')
@@ -106,121 +85,145 @@ def _padronizar_dados(dados_do_formulario):
     })
     return dados_padronizados
 
-# --- FUNÇÕES DO GOOGLE SHEETS (sem alterações) ---
+# --- FUNÇÕES DO GOOGLE SHEETS ---
+# A aba mensal fica em memória (indice_planilha): a busca é por chave e não baixa a planilha a cada requisição.
+# As escritas passam pela fila_sheets, que junta as operações de várias requisições num único lote por aba.
+def _obter_indice_planilha(dados):
+    sheet_gid = dados['id_sheets'].split('gid=')[-1]
+    return obter_indice_planilha(clientes_google.gspread(), GOOGLE_SHEET_ID, sheet_gid, _normalize_valor_to_decimal)
+
 def _buscar_e_atualizar_linha_existente(dados):
-    if not all([gspread_client, dados.get('id_sheets'), GOOGLE_SHEET_ID]): return False
+    if not all([dados.get('id_sheets'), GOOGLE_SHEET_ID]): return False
     try:
-        sheet_gid = dados['id_sheets'].split('gid=')[-1]
-        worksheet = gspread_client.open_by_key(GOOGLE_SHEET_ID).get_worksheet_by_id(int(sheet_gid))
-        all_data = worksheet.get_all_values()
-        if not all_data: return False
-        header = all_data[0]
-        try:
-            conta_idx, valor_idx, vencimento_idx = header.index('Conta'), header.index('Valor'), header.index('Data de vencimento')
-        except ValueError: return False
-        fornecedor_chave, valor_chave_decimal, vencimento_chave = dados.get('nome_padronizado'), _normalize_valor_to_decimal(dados.get('valor')), dados.get('vencimento')
-        for index, row_data in enumerate(all_data[1:]):
-            if len(row_data) <= max(conta_idx, valor_idx, vencimento_idx): continue
-            if (row_data[conta_idx] == fornecedor_chave and _normalize_valor_to_decimal(row_data[valor_idx]) == valor_chave_decimal and row_data[vencimento_idx] == vencimento_chave):
-                mapeamento = {'Meio Pagto': 'meio_pagamento', 'Nro NF': 'numero_nota', 'Data de Emissão da nota': 'emissao', 'Data do pagamento': 'pagamento'}
-                celulas = []
-                for col_nome, dado_chave in mapeamento.items():
-                    if dados.get(dado_chave):
-                        try:
-                            col_idx = header.index(col_nome)
-                            if len(row_data) <= col_idx or str(row_data[col_idx]).strip() == '':
-                                celulas.append(gspread.Cell(row=index + 2, col=col_idx + 1, value=dados.get(dado_chave)))
-                        except ValueError: pass
-                if celulas: worksheet.update_cells(celulas, value_input_option='USER_ENTERED')
-                return True
+        indice = _obter_indice_planilha(dados)
+        if not indice.colunas_chave_presentes(): return False
+        encontrado = indice.buscar_confirmado(dados.get('nome_padronizado'), dados.get('valor'), dados.get('vencimento'))
+        if not encontrado: return False
+        numero_linha, row_data = encontrado
+        mapeamento = {'Meio Pagto': 'meio_pagamento', 'Nro NF': 'numero_nota', 'Data de Emissão da nota': 'emissao', 'Data do pagamento': 'pagamento'}
+        celulas = []
+        for col_nome, dado_chave in mapeamento.items():
+            col_idx = indice.posicoes.get(col_nome)
+            if dados.get(dado_chave) and col_idx is not None:
+                if len(row_data) <= col_idx or str(row_data[col_idx]).strip() == '':
+                    celulas.append(gspread.Cell(row=numero_linha, col=col_idx + 1, value=dados.get(dado_chave)))
+        if celulas: fila_sheets.aguardar(fila_sheets.enfileirar_atualizacao(indice, numero_linha, celulas), FILA_SHEETS_TIMEOUT)
+        return True
+    except Exception as e:
+        # As chamadas já passaram pelas novas tentativas do limitador_google; aqui só resta registrar a falha.
+        logging.error(f"Erro ao buscar/atualizar a linha existente no Sheets: {e}")
         return False
-    except Exception: return False
 
 def _adicionar_nova_linha_sheets(dados):
-    if not all([gspread_client, dados.get('id_sheets'), GOOGLE_SHEET_ID]): return False
+    if not all([dados.get('id_sheets'), GOOGLE_SHEET_ID]): return False
     try:
-        sheet_gid = dados['id_sheets'].split('gid=')[-1]
-        worksheet = gspread_client.open_by_key(GOOGLE_SHEET_ID).get_worksheet_by_id(int(sheet_gid))
+        indice = _obter_indice_planilha(dados)
         linha_base = {'Conta': dados.get('nome_padronizado', ''), 'Meio Pagto': dados.get('meio_pagamento', 'BOLETO'), 'Nro NF': dados.get('numero_nota', ''), 'Valor': dados.get('valor_formatado_brl', ''), 'Data de Emissão da nota': dados.get('emissao', ''), 'Data de vencimento': dados.get('vencimento', ''), 'Data do pagamento': dados.get('pagamento', '')}
-        worksheet.append_row([linha_base.get(col, '') for col in worksheet.row_values(1)], value_input_option='USER_ENTERED')
-        return True
-    except Exception: return False
+        nova_linha = [linha_base.get(col, '') for col in indice.cabecalho]
+        return fila_sheets.aguardar(fila_sheets.enfileirar_nova_linha(indice, nova_linha), FILA_SHEETS_TIMEOUT)
+    except Exception as e:
+        logging.error(f"Erro ao incluir a nova linha no Sheets: {e}")
+        return False
 
 # --- ALTERAÇÃO 2: MECÂNICA DE UPLOAD INTELIGENTE ---
-def _executar_upload_drive(dados, caminhos_arquivos_locais, nomes_originais_arquivos):
-    if not all([drive_service, dados.get('id_drive'), dados.get('nome_padronizado') != "NÃO SEI"]): return 0
+# A pasta do fornecedor fica em cache no uploader_drive e o contador de partes no registro de idempotência; os anexos sobem em paralelo.
+# Um conteúdo (sha256) já enviado à pasta do fornecedor não é enviado de novo nem consome número de parte.
+# `dono` (a chave de idempotência) permite retomar as reservas de envio de uma execução interrompida do mesmo job.
+def _executar_upload_drive(dados, documentos, dono=None):
+    """Devolve (arquivos enviados agora, arquivos que já estavam na pasta)."""
+    if not all([dados.get('id_drive'), dados.get('nome_padronizado') != "NÃO SEI"]): return 0, 0
     
-    uploads_bem_sucedidos = 0
     try:
-        id_pasta_mes = dados['id_drive']
-        nome_fornecedor = dados['nome_padronizado']
-        query_pasta = f"'{id_pasta_mes}' in parents and name = '{nome_fornecedor}' and mimeType = 'application/vnd.google-apps.folder' and trashed = false"
-        results_pasta = drive_service.files().list(q=query_pasta, fields="files(id)").execute()
-        id_pasta_fornecedor = results_pasta.get('files', [{}])[0].get('id') or drive_service.files().create(body={'name': nome_fornecedor, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [id_pasta_mes]}, fields='id').execute().get('id')
-        
+        drive_service = clientes_google.drive()
+        id_pasta_fornecedor = uploader_drive.obter_pasta_fornecedor(drive_service, dados['id_drive'], dados['nome_padronizado'])
         prefixo_arquivo = f"{datetime.strptime(dados['vencimento'], '%d/%m/%Y').strftime('%d-%m-%Y')} - R${dados['valor_formatado_brl']}"
 
-        # --- Início da nova lógica: Contar ficheiros existentes ---
-        query_ficheiros_existentes = f"'{id_pasta_fornecedor}' in parents and name contains '{prefixo_arquivo}' and trashed = false"
-        results_ficheiros = drive_service.files().list(q=query_ficheiros_existentes, fields="files(name)").execute()
-        ficheiros_existentes = results_ficheiros.get('files', [])
-        parte_inicial = len(ficheiros_existentes)
-        logging.info(f"Encontrados {parte_inicial} ficheiros existentes com o mesmo prefixo. O novo upload começará da parte {parte_inicial + 1}.")
-        # --- Fim da nova lógica ---
-        
-        for i, (caminho, nome_original) in enumerate(zip(caminhos_arquivos_locais, nomes_originais_arquivos)):
-            if not os.path.exists(caminho):
-                logging.warning(f"O ficheiro temporário {Path(caminho).name} não foi encontrado. A ignorar.")
-                continue
-            try:
-                # O número da parte agora é baseado na contagem de ficheiros existentes
-                parte_numero = parte_inicial + i + 1
-                nome_final = f"{prefixo_arquivo} - parte {parte_numero}{Path(nome_original).suffix}"
-                
-                metadata = {'name': nome_final, 'parents': [id_pasta_fornecedor]}
-                with open(caminho, 'rb') as f:
-                    media = MediaIoBaseUpload(f, mimetype='application/octet-stream', resumable=True)
-                    drive_service.files().create(body=metadata, media_body=media, fields='id').execute()
-                
-                uploads_bem_sucedidos += 1
-                os.remove(caminho)
-                logging.info(f"Upload e limpeza de '{Path(caminho).name}' como '{nome_final}' bem-sucedidos.")
-            except Exception as e_file:
-                logging.error(f"Erro no upload ou limpeza do ficheiro {nome_original}: {e_file}")
-        
-        return uploads_bem_sucedidos
+        arquivos, ja_enviados, conteudos = [], 0, set()
+        try:
+            for documento in documentos:
+                if not documento.existe():
+                    logging.warning(f"O conteúdo de {documento.nome} não está mais disponível. A ignorar.")
+                    continue
+                if documento.sha256 in conteudos:
+                    logging.info(f"O conteúdo de {documento.nome} repete outro arquivo desta requisição. A ignorar.")
+                    ja_enviados += 1
+                    continue
+                conteudos.add(documento.sha256)
+                nome_existente = registro_idempotencia.reservar_arquivo(id_pasta_fornecedor, documento.sha256, documento.nome, dono)
+                if nome_existente is not None:
+                    logging.info(f"O conteúdo de {documento.nome} já está na pasta do fornecedor como '{nome_existente}'. A ignorar.")
+                    ja_enviados += 1
+                    continue
+                arquivos.append(documento)
+        except Exception:
+            # Ex.: ArquivoEmEnvio. As reservas já feitas são desfeitas para que a nova tentativa do job as refaça.
+            for documento in arquivos: registro_idempotencia.liberar_arquivo(id_pasta_fornecedor, documento.sha256)
+            raise
+        if not arquivos: return 0, ja_enviados
+
+        try:
+            parte_inicial = uploader_drive.reservar_partes(drive_service, id_pasta_fornecedor, prefixo_arquivo, len(arquivos))
+            logging.info(f"O novo upload usará as partes {parte_inicial} a {parte_inicial + len(arquivos) - 1}.")
+            envios = [(documento, f"{prefixo_arquivo} - parte {parte_inicial + i}{Path(documento.nome).suffix}") for i, documento in enumerate(arquivos)]
+            resultados = uploader_drive.enviar(drive_service, id_pasta_fornecedor, envios)
+        except Exception:
+            for documento in arquivos: registro_idempotencia.liberar_arquivo(id_pasta_fornecedor, documento.sha256)
+            raise
+        for (documento, nome_final), enviado in zip(envios, resultados):
+            if enviado:
+                registro_idempotencia.confirmar_arquivo(id_pasta_fornecedor, documento.sha256, nome_final)
+            else:
+                registro_idempotencia.liberar_arquivo(id_pasta_fornecedor, documento.sha256)
+        return sum(resultados), ja_enviados
     except Exception as e:
         logging.error(f"Erro geral no processo do Drive: {e}")
-        return uploads_bem_sucedidos
+        return 0, 0
 
-# --- FUNÇÃO PRINCIPAL (sem alterações) ---
-def processar_documento_com_dados_manuais(caminhos_arquivos, dados_formulario, nomes_originais_arquivos):
-    if not creds: return {'status': 'ERRO', 'detalhes': 'Credenciais do Google não foram carregadas.'}
+# --- FUNÇÃO PRINCIPAL ---
+# Com `chave_idempotencia`, a etapa do Sheets já concluída numa execução anterior da mesma requisição não é refeita.
+def processar_documento_com_dados_manuais(documentos, dados_formulario, progresso=None, chave_idempotencia=None):
+    # `progresso(percentual, mensagem)` é opcional; a fila de jobs usa-o para informar em que etapa o documento está.
+    progresso = progresso or (lambda percentual, mensagem=None: None)
+    if not clientes_google.disponivel(): return {'status': 'ERRO', 'detalhes': f'Credenciais do Google não foram carregadas. Autorize o acesso com `{COMANDO_AUTORIZACAO}`.'}
     dados_completos = _padronizar_dados(dados_formulario)
     if not all([dados_completos.get('nome_padronizado') != "NÃO SEI", dados_completos.get('id_drive'), dados_completos.get('id_sheets')]):
         return {'status': 'ERRO', 'detalhes': 'Não foi possível identificar o fornecedor ou o mês de lançamento.'}
-    linha_existe = _buscar_e_atualizar_linha_existente(dados_completos)
-    sucesso_sheets = True if linha_existe else _adicionar_nova_linha_sheets(dados_completos)
-    if not sucesso_sheets: return {'status': 'ERRO', 'detalhes': 'Falha na operação com o Google Sheets.'}
+    progresso(10, 'Atualizando o Google Sheets')
+    etapa_sheets = registro_idempotencia.etapa_concluida(chave_idempotencia, 'sheets')
+    if etapa_sheets is not None:
+        logging.info("A etapa do Sheets já foi concluída para esta requisição. A ignorar.")
+        linha_existe = etapa_sheets['linha_existe']
+    else:
+        with metricas.medir('processador.sheets_linha_existente'):
+            linha_existe = _buscar_e_atualizar_linha_existente(dados_completos)
+        if linha_existe:
+            sucesso_sheets = True
+        else:
+            with metricas.medir('processador.sheets_nova_linha'):
+                sucesso_sheets = _adicionar_nova_linha_sheets(dados_completos)
+        if not sucesso_sheets: return {'status': 'ERRO', 'detalhes': 'Falha na operação com o Google Sheets.'}
+        registro_idempotencia.concluir_etapa(chave_idempotencia, 'sheets', {'linha_existe': linha_existe})
     mensagem_sheets = "Linha existente atualizada no Sheets" if linha_existe else "Nova linha criada no Sheets"
-    contagem_uploads = _executar_upload_drive(dados_completos, caminhos_arquivos, nomes_originais_arquivos)
-    if contagem_uploads > 0:
-        return {'status': 'SUCESSO', 'detalhes': f'{mensagem_sheets} e {contagem_uploads} arquivo(s) salvos no Drive.'}
-    elif len(caminhos_arquivos) > 0:
-        return {'status': 'ERRO', 'detalhes': f'A operação no Sheets foi concluída, mas falhou ao salvar {len(caminhos_arquivos)} arquivo(s) no Drive.'}
+    progresso(50, 'Enviando arquivos ao Google Drive')
+    with metricas.medir('processador.upload_drive'):
+        contagem_uploads, contagem_existentes = _executar_upload_drive(dados_completos, documentos, dono=chave_idempotencia)
+    mensagem_existentes = f" ({contagem_existentes} arquivo(s) já estavam no Drive)" if contagem_existentes else ""
+    if contagem_uploads + contagem_existentes > 0:
+        return {'status': 'SUCESSO', 'detalhes': f'{mensagem_sheets} e {contagem_uploads} arquivo(s) salvos no Drive{mensagem_existentes}.'}
+    elif len(documentos) > 0:
+        return {'status': 'ERRO', 'detalhes': f'A operação no Sheets foi concluída, mas falhou ao salvar {len(documentos)} arquivo(s) no Drive.'}
     else:
         return {'status': 'SUCESSO', 'detalhes': f'{mensagem_sheets}. Nenhum arquivo para salvar no Drive.'}
 
-# --- FUNÇÕES DE OCR (sem alterações) ---
-def _extrair_texto_pdf_com_ocr(caminho_pdf):
-    try:
-        return "".join(pytesseract.image_to_string(img, lang='por') + "\n" for img in convert_from_path(caminho_pdf))
-    except Exception: return ""
+# --- FUNÇÕES DE OCR ---
+# A leitura das páginas fica a cargo do motor_ocr: camada de texto nativa primeiro, Tesseract só quando necessário.
+
+VERSAO_ANALISE_COMPROVANTE = 3
 
 def _analisar_texto_bruto_comprovante(texto):
     dados = {'fornecedor': '', 'valor': '', 'pagamento': ''}
-    melhor_match = process.extractOne(texto, list(mapeamento_fornecedores.keys()), score_cutoff=85)
-    if melhor_match: dados['fornecedor'] = melhor_match[0]
+    with metricas.medir('fornecedores.buscar_no_texto'):
+        dados['fornecedor'] = obter_indice(mapeamento_fornecedores).buscar_no_texto(texto) or ''
     valores = re.findall(r'R\$\s*([\d.,]+)', texto)
     if valores: dados['valor'] = valores[-1].strip()
     datas = re.findall(r'(\d{2}/\d{2}/\d{4})', texto)
@@ -228,12 +231,39 @@ def _analisar_texto_bruto_comprovante(texto):
     dados['vencimento'] = dados['pagamento']
     return dados
 
-def analisar_comprovante_ocr(lista_caminhos_pdf, dados_parciais):
+def _comprovante_completo(texto):
+    dados = _analisar_texto_bruto_comprovante(texto)
+    return all(dados.get(campo) for campo in ('fornecedor', 'valor', 'pagamento'))
+
+def _chave_cache_ocr(documento):
+    try:
+        # A versão da análise e a do mapeamento entram na chave: mudar as regras de extração invalida os resultados antigos.
+        configuracao = dict(configuracao_ocr(), analise=VERSAO_ANALISE_COMPROVANTE, fornecedores=obter_indice(mapeamento_fornecedores).versao)
+        return cache_ocr.chave(documento.sha256, configuracao)
+    except OSError as e:
+        logging.warning(f"Não foi possível calcular a chave de cache de '{documento.nome}': {e}")
+        return None
+
+def analisar_comprovante_ocr(documentos, dados_parciais, progresso=None):
+    # Os documentos pertencem a quem chamou (a fila de jobs), que os descarta no fim.
+    progresso = progresso or (lambda percentual, mensagem=None: None)
     dados_agregados = {'fornecedor': '', 'valor': None, 'pagamento': None}
-    for caminho in lista_caminhos_pdf:
-        texto = _extrair_texto_pdf_com_ocr(caminho)
+
+    # Resultados já conhecidos vêm do cache; só os arquivos novos passam pela extração.
+    chaves = [_chave_cache_ocr(documento) for documento in documentos]
+    resultados = [cache_ocr.obter(chave) if chave else None for chave in chaves]
+    pendentes = [i for i, dados_pdf in enumerate(resultados) if dados_pdf is None]
+    progresso(10, f'Extraindo texto de {len(pendentes)} arquivo(s)')
+    with metricas.medir('ocr.extracao'):
+        textos = extrair_textos([documentos[i] for i in pendentes], criterio_parada=_comprovante_completo)
+    for i, texto in zip(pendentes, textos):
         if texto:
-            dados_pdf = _analisar_texto_bruto_comprovante(texto)
+            resultados[i] = _analisar_texto_bruto_comprovante(texto)
+            if chaves[i]: cache_ocr.guardar(chaves[i], resultados[i])
+    logging.info(f"Cache de OCR: {len(documentos) - len(pendentes)} acerto(s) nesta requisição. Totais: {cache_ocr.estatisticas()}")
+
+    for dados_pdf in resultados:
+        if dados_pdf:
             if not dados_agregados.get('fornecedor') and dados_pdf.get('fornecedor'): dados_agregados['fornecedor'] = dados_pdf['fornecedor']
             valor_dec = _normalize_valor_to_decimal(dados_pdf.get('valor'))
             if valor_dec and (dados_agregados['valor'] is None or valor_dec > dados_agregados['valor']): dados_agregados['valor'] = valor_dec
@@ -242,8 +272,6 @@ def analisar_comprovante_ocr(lista_caminhos_pdf, dados_parciais):
                     data_obj = datetime.strptime(dados_pdf.get('pagamento'), "%d/%m/%Y")
                     if dados_agregados['pagamento'] is None or data_obj > dados_agregados['pagamento']: dados_agregados['pagamento'] = data_obj
                 except ValueError: pass
-        try: os.remove(caminho)
-        except Exception as e: logging.error(f"Erro ao limpar ficheiro OCR temporário: {e}")
     pagamento_str = dados_agregados['pagamento'].strftime("%d/%m/%Y") if dados_agregados['pagamento'] else ""
     dados_finais = {
         'fornecedor': dados_parciais.get('fornecedor') or dados_agregados.get('fornecedor'),
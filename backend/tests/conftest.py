@@ -0,0 +1,18 @@
+# backend/tests/conftest.py
+
+import os
+import sys
+import tempfile
+
+# Os módulos do backend leem a configuração e criam os seus bancos na importação: tudo vai para uma pasta temporária.
+_PASTA_TESTES = tempfile.mkdtemp(prefix='testes-backend-')
+os.environ.update({
+    'JOBS_DB': os.path.join(_PASTA_TESTES, 'jobs.db'),
+    'IDEMPOTENCIA_DB': os.path.join(_PASTA_TESTES, 'idempotencia.db'),
+    'GOOGLE_COTA_ESTADO': os.path.join(_PASTA_TESTES, 'google_cota.json'),
+    'OCR_CACHE_PASTA': os.path.join(_PASTA_TESTES, 'ocr_cache'),
+    'DATABASE_URL': f"sqlite:///{os.path.join(_PASTA_TESTES, 'vendas.db')}",
+})
+
+# O backend importa os módulos vizinhos pelo nome (processador, fila_jobs...).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
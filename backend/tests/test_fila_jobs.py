@@ -0,0 +1,66 @@
+# backend/tests/test_fila_jobs.py
+
+import threading
+import time
+
+import pytest
+
+from documentos import DocumentoEnviado
+from fila_jobs import FilaJobs, ConflitoIdempotencia, EXECUTANDO
+
+
+@pytest.fixture
+def fila(tmp_path):
+    fila = FilaJobs(str(tmp_path / 'jobs.db'), max_workers=1)
+    fila.registrar('upload', lambda parametros, documentos, progresso: {'status': 'SUCESSO'})
+    # Sem workers: os testes reservam os jobs diretamente.
+    fila._acordar_workers = lambda: None
+    return fila
+
+def _contar_jobs(fila):
+    with fila._conectar() as conexao:
+        return conexao.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+
+def test_requisicoes_identicas_simultaneas_criam_um_unico_job(fila):
+    quantidade = 8
+    barreira = threading.Barrier(quantidade)
+    resultados = []
+
+    def enviar():
+        documentos = [DocumentoEnviado('boleto.pdf', conteudo=b'%PDF conteudo')]
+        barreira.wait()
+        resultados.append(fila.enfileirar_idempotente('upload', 'chave-1', 'impressao-1', {'dados': {}}, documentos))
+
+    threads = [threading.Thread(target=enviar) for _ in range(quantidade)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    assert len({job_id for job_id, _ in resultados}) == 1
+    assert sum(novo for _, novo in resultados) == 1
+    assert _contar_jobs(fila) == 1
+
+def test_mesma_chave_com_outro_conteudo_e_rejeitada(fila):
+    fila.enfileirar_idempotente('upload', 'chave-1', 'impressao-1', {'dados': {}})
+    with pytest.raises(ConflitoIdempotencia):
+        fila.enfileirar_idempotente('upload', 'chave-1', 'impressao-2', {'dados': {}})
+
+
+def test_job_com_prazo_vencido_volta_para_a_fila(fila):
+    job_id = fila.enfileirar('upload', {'dados': {}})
+    assert fila._reservar_proximo()['id'] == job_id
+    # O processo que pegou o job morreu: ninguém renovou o prazo.
+    with fila._conectar() as conexao:
+        conexao.execute("UPDATE jobs SET lease_ate = ? WHERE id = ?", (time.time() - 1, job_id))
+
+    linha = fila._reservar_proximo()
+
+    assert linha is not None and linha['id'] == job_id
+    assert fila.obter(job_id)['status'] == EXECUTANDO
+
+def test_job_com_prazo_em_dia_nao_e_pego_de_novo(fila):
+    job_id = fila.enfileirar('upload', {'dados': {}})
+    assert fila._reservar_proximo()['id'] == job_id
+
+    assert fila._reservar_proximo() is None
+    assert fila.obter(job_id)['status'] == EXECUTANDO
@@ -0,0 +1,59 @@
+# backend/tests/test_idempotencia.py
+
+import pytest
+
+import processador
+from documentos import DocumentoEnviado
+from idempotencia import RegistroIdempotencia, ArquivoEmEnvio
+
+
+@pytest.fixture
+def registro(tmp_path):
+    return RegistroIdempotencia(str(tmp_path / 'idempotencia.db'), reserva_expira=900)
+
+
+def test_arquivo_enviando_nao_conta_como_enviado(registro):
+    assert registro.reservar_arquivo('pasta', 'sha-1', 'boleto.pdf', dono='chave-a') is None
+
+    with pytest.raises(ArquivoEmEnvio):
+        registro.reservar_arquivo('pasta', 'sha-1', 'boleto.pdf', dono='chave-b')
+
+def test_reserva_do_mesmo_dono_e_retomada(registro):
+    registro.reservar_arquivo('pasta', 'sha-1', 'boleto.pdf', dono='chave-a')
+    assert registro.reservar_arquivo('pasta', 'sha-1', 'boleto.pdf', dono='chave-a') is None
+
+def test_so_envio_confirmado_devolve_o_nome_existente(registro):
+    registro.reservar_arquivo('pasta', 'sha-1', 'boleto.pdf', dono='chave-a')
+    registro.confirmar_arquivo('pasta', 'sha-1', '01-07-2025 - R$10,00 - parte 1.pdf')
+
+    assert registro.reservar_arquivo('pasta', 'sha-1', 'boleto.pdf', dono='chave-b') == '01-07-2025 - R$10,00 - parte 1.pdf'
+
+
+class _UploaderFalso:
+    def __init__(self):
+        self.envios = []
+
+    def obter_pasta_fornecedor(self, drive_service, id_pasta_mes, nome_fornecedor):
+        return 'pasta-fornecedor'
+
+    def reservar_partes(self, drive_service, id_pasta_fornecedor, prefixo, quantidade):
+        return 1
+
+    def enviar(self, drive_service, id_pasta, envios):
+        self.envios.extend(envios)
+        return [True] * len(envios)
+
+def test_upload_nao_informa_como_enviado_arquivo_ainda_enviando(registro, monkeypatch):
+    uploader = _UploaderFalso()
+    monkeypatch.setattr(processador, 'registro_idempotencia', registro)
+    monkeypatch.setattr(processador, 'uploader_drive', uploader)
+    monkeypatch.setattr(processador.clientes_google, 'drive', lambda: object())
+    documento = DocumentoEnviado('boleto.pdf', conteudo=b'%PDF conteudo')
+    dados = {'id_drive': 'pasta-mes', 'nome_padronizado': 'ILLY', 'vencimento': '01/07/2025', 'valor_formatado_brl': '10,00'}
+    # Outra requisição reservou o mesmo conteúdo e ainda não confirmou o envio.
+    registro.reservar_arquivo('pasta-fornecedor', documento.sha256, 'boleto.pdf', dono='outra-chave')
+
+    enviados, ja_enviados = processador._executar_upload_drive(dados, [documento], dono='chave-a')
+
+    assert (enviados, ja_enviados) == (0, 0)
+    assert uploader.envios == []
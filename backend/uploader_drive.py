@@ -0,0 +1,104 @@
+# backend/uploader_drive.py
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from googleapiclient.http import MediaIoBaseUpload
+
+from idempotencia import registro_idempotencia
+from limitador_google import limitador_google
+from metricas import metricas
+
+# --- CONFIGURAÇÃO DO UPLOADER ---
+DRIVE_MAX_WORKERS = int(os.getenv('DRIVE_MAX_WORKERS', '4'))
+# Arquivos até este tamanho vão num único pedido (upload simples); os maiores usam sessão resumable.
+DRIVE_LIMITE_UPLOAD_SIMPLES = int(os.getenv('DRIVE_LIMITE_UPLOAD_SIMPLES', str(5 * 1024 * 1024)))
+# Validade (segundos) do ID das pastas em cache e da contagem de partes no Drive; depois disso são consultados de novo.
+DRIVE_CACHE_TTL = float(os.getenv('DRIVE_CACHE_TTL', '600'))
+
+MIMETYPE_PASTA = 'application/vnd.google-apps.folder'
+
+
+class UploaderDrive:
+    """
+    Envia os anexos ao Google Drive em paralelo (pool de threads limitado), guardando em memória, por `cache_ttl`
+    segundos, o ID das pastas de fornecedor. O contador de partes de cada prefixo fica no registro de idempotência
+    (SQLite), para que requisições simultâneas, mesmo em processos diferentes, não repitam números.
+    O drive_service recebido deve ser seguro entre threads (ver clientes_google).
+    """
+
+    def __init__(self, max_workers, limite_upload_simples, cache_ttl):
+        self.limite_upload_simples = limite_upload_simples
+        self.cache_ttl = cache_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-drive')
+        self._lock = threading.Lock()
+        self._locks_por_chave = {}
+        self._pastas = {}    # (id_pasta_mes, nome_fornecedor) -> (id da pasta, momento da consulta)
+
+    def _lock_da_chave(self, chave):
+        with self._lock:
+            return self._locks_por_chave.setdefault(chave, threading.Lock())
+
+    def _pasta_em_cache(self, chave):
+        id_pasta, momento = self._pastas.get(chave, (None, 0))
+        return id_pasta if time.monotonic() - momento < self.cache_ttl else None
+
+    def obter_pasta_fornecedor(self, drive_service, id_pasta_mes, nome_fornecedor):
+        chave = (id_pasta_mes, nome_fornecedor)
+        id_pasta = self._pasta_em_cache(chave)
+        if id_pasta: return id_pasta
+        with self._lock_da_chave(('pasta',) + chave):
+            id_pasta = self._pasta_em_cache(chave)
+            if id_pasta: return id_pasta
+            nome_escapado = nome_fornecedor.replace("\\", "\\\\").replace("'", "\\'")
+            query_pasta = f"'{id_pasta_mes}' in parents and name = '{nome_escapado}' and mimeType = '{MIMETYPE_PASTA}' and trashed = false"
+            resultado = limitador_google.executar('drive', 'list', lambda: drive_service.files().list(q=query_pasta, fields="files(id)").execute())
+            arquivos = resultado.get('files', [])
+            id_pasta = arquivos[0].get('id') if arquivos else None
+            if not id_pasta:
+                corpo = {'name': nome_fornecedor, 'mimeType': MIMETYPE_PASTA, 'parents': [id_pasta_mes]}
+                id_pasta = limitador_google.executar('drive', 'criar_pasta', lambda: drive_service.files().create(body=corpo, fields='id').execute(), repetivel=False).get('id')
+                logging.info(f"Pasta '{nome_fornecedor}' criada no Drive.")
+            self._pastas[chave] = (id_pasta, time.monotonic())
+            return id_pasta
+
+    def reservar_partes(self, drive_service, id_pasta_fornecedor, prefixo, quantidade):
+        """Reserva `quantidade` números de parte consecutivos para o prefixo e devolve o primeiro deles."""
+        def contar_existentes():
+            prefixo_escapado = prefixo.replace("\\", "\\\\").replace("'", "\\'")
+            query = f"'{id_pasta_fornecedor}' in parents and name contains '{prefixo_escapado}' and trashed = false"
+            resultado = limitador_google.executar('drive', 'list', lambda: drive_service.files().list(q=query, fields="files(name)").execute())
+            existentes = len(resultado.get('files', []))
+            logging.info(f"Encontrados {existentes} ficheiros existentes com o prefixo '{prefixo}'.")
+            return existentes
+        return registro_idempotencia.reservar_partes(id_pasta_fornecedor, prefixo, quantidade, contar_existentes, self.cache_ttl)
+
+    def _enviar_arquivo(self, drive_service, id_pasta, documento, nome_final):
+        metadata = {'name': nome_final, 'parents': [id_pasta]}
+        with documento.abrir() as f:
+            media = MediaIoBaseUpload(f, mimetype='application/octet-stream', resumable=documento.tamanho > self.limite_upload_simples)
+            limitador_google.executar('drive', 'create', lambda: drive_service.files().create(body=metadata, media_body=media, fields='id').execute(), repetivel=False)
+        logging.info(f"Upload de '{documento.nome}' como '{nome_final}' bem-sucedido.")
+        return True
+
+    def enviar(self, drive_service, id_pasta, envios):
+        """
+        Envia em paralelo a lista de (documento, nome_final) para a pasta `id_pasta`.
+        Devolve uma lista de booleanos indicando o sucesso de cada envio, na mesma ordem.
+        """
+        futuros = [self._executor.submit(metricas.propagar(self._enviar_arquivo), drive_service, id_pasta, documento, nome_final)
+                   for documento, nome_final in envios]
+        resultados = []
+        for (_, nome_final), futuro in zip(envios, futuros):
+            try:
+                resultados.append(futuro.result())
+            except Exception as e:
+                logging.error(f"Erro no upload do ficheiro {nome_final}: {e}")
+                resultados.append(False)
+        return resultados
+
+
+uploader_drive = UploaderDrive(DRIVE_MAX_WORKERS, DRIVE_LIMITE_UPLOAD_SIMPLES, DRIVE_CACHE_TTL)
@@ -1,6 +1,7 @@
 // frontend/src/components/ComprovantesForm.tsx
 
 import React, { useState, useRef } from 'react';
+import { aguardarJob } from './aguardarJob';
 
 interface OcrData {
     fornecedor?: string;
@@ -74,8 +75,7 @@ const ComprovantesForm: React.FC = () => {
         try {
             const formData = getFormData();
             const response = await fetch('http://127.0.0.1:5000/analisar-comprovante', { method: 'POST', body: formData });
-            const result: OcrData = await response.json();
-            if (!response.ok) throw new Error((result as any).detalhes || 'Erro na análise.');
+            const result: OcrData = (await aguardarJob(response)).dados;
             
             const form = formRef.current!;
             const filled: string[] = [];
@@ -100,8 +100,7 @@ const ComprovantesForm: React.FC = () => {
         try {
             const formData = getFormData();
             const response = await fetch('http://127.0.0.1:5000/upload', { method: 'POST', body: formData });
-            const result = await response.json();
-            if (!response.ok) throw new Error(result.detalhes || 'Erro no envio.');
+            const result = await aguardarJob(response);
 
             setStatusMessage({ text: `Sucesso: ${result.detalhes}`, type: 'success' });
             setShowReset(true);
@@ -1,6 +1,7 @@
 
 
 import React, { useState, useRef } from 'react';
+import { aguardarJob } from './aguardarJob';
 
 const Uploadform: React.FC = () => {
     const [selectedFiles, setSelectedFiles] = useState<File[]>([]);
@@ -63,8 +64,7 @@ const Uploadform: React.FC = () => {
                 body: formData,
             });
 
-            const result = await response.json();
-            if (!response.ok) throw new Error(result.detalhes || 'Ocorreu um erro.');
+            const result = await aguardarJob(response);
 
             setStatusMessage(`Sucesso: ${result.detalhes}`);
             setShowReset(true);
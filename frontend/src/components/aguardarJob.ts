@@ -0,0 +1,21 @@
+// frontend/src/components/aguardarJob.ts
+
+// Os endpoints /upload e /analisar-comprovante respondem 202 com o id de um job em segundo plano.
+// Esta função consulta /jobs/<id> até o job terminar e devolve o resultado (ou lança o erro informado pelo backend).
+// Depois de esperaMaximaMs sem o job terminar, desiste com um erro em vez de consultar para sempre.
+export async function aguardarJob(response: Response, intervaloMs = 1000, esperaMaximaMs = 10 * 60 * 1000): Promise<any> {
+    const inicial = await response.json();
+    if (!response.ok) throw new Error(inicial.detalhes || 'Ocorreu um erro.');
+    if (response.status !== 202) return inicial;
+
+    const limite = Date.now() + esperaMaximaMs;
+    while (Date.now() < limite) {
+        await new Promise(resolve => setTimeout(resolve, intervaloMs));
+        const statusResponse = await fetch(`http://127.0.0.1:5000/jobs/${inicial.job_id}`);
+        const job = await statusResponse.json();
+        if (!statusResponse.ok) throw new Error(job.detalhes || 'Erro ao consultar o processamento.');
+        if (job.status === 'CONCLUIDO') return job.resultado;
+        if (job.status === 'ERRO') throw new Error(job.resultado?.detalhes || job.mensagem || 'Erro no processamento.');
+    }
+    throw new Error('O processamento está demorando mais que o esperado. Verifique o resultado mais tarde.');
+}